@@ -3,22 +3,23 @@ import math
 from collections import defaultdict
 from typing import Dict, List, Tuple
 
-from pathfinding.core.grid import Grid
-from pathfinding.finder.a_star import AStarFinder
-from pathfinding.finder.breadth_first import BreadthFirstFinder
 from pathfinding.core.diagonal_movement import DiagonalMovement
 
 from board import Board
+from grid_astar import find_path, find_path_breadth_first, grid_point
 from layer import Layer
 from objects import Point, Segment
 
-from router import Router
+from router import Router, block_around_cells
 import debug
 import debug_visualizer
 
 import sys
 
 import thread_context
+
+# How many recent pathfinding results each bus router keeps for reuse
+PATH_CACHE_SIZE = 32
     
 class BusRouter(Router):
     """
@@ -52,6 +53,10 @@ class BusRouter(Router):
             )
 
         self._routed_sockets = set()
+
+        # Searches already run, keyed by the grid's contents and everything else that decides the path, since 
+        # backtracking can rip up and reroute sockets onto exactly the same grid again
+        self.path_cache = {}
         
         # Create bus segments 
         self.bus_segments = self._create_buses(tracks_layer, buses_layer)
@@ -321,32 +326,65 @@ class BusRouter(Router):
             return temporary_obstacle_grid
         
         # Find other nets on the same layer
+        path_cells = []
         for net in current_layer.nets:
             if net == net_to_protect and self.board.allow_overlap:
                 continue  # Allow overlap would allow this net to overlap (short) with itself
             
-            # Mark all paths in the bus area with a larger keep-out zone around it
             for path_index in self.paths_indices.get(net, []):
-                for x, y, _ in path_index:
-                    if 0 <= y < self.grid_height and start_col <= x <= end_col:     
-                        for dy in range(-1, 2): # 2 extra grid cells of keep out on left and right
-                            for dx in range(-1, 2): # 1 extra grid cell of keep out on top and bottom
-                                ny, nx = y + dy, x + dx
-                                if 0 <= ny < self.grid_height and 0 <= nx < self.grid_width:
-                                    temporary_obstacle_grid[ny, nx] = self.BLOCKED_CELL
+                path_cells.extend(path_index)
+        
+        # Mark all paths in the bus area with a larger keep-out zone around it, 1 extra grid cell on every side
+        bus_area_cells = self._cells_inside_grid(path_cells, start_col, end_col)
+        block_around_cells(temporary_obstacle_grid, bus_area_cells, 1, self.BLOCKED_CELL)
         
         # Ensure edge columns are always free
         if self.side == 'left':
             # For left side, keep leftmost column free
-            for y in range(self.grid_height):
-                temporary_obstacle_grid[y, 0] = self.FREE_CELL
+            temporary_obstacle_grid[:, 0] = self.FREE_CELL
         elif self.side == 'right':
             # For right side, keep rightmost column free
-            for y in range(self.grid_height):
-                temporary_obstacle_grid[y, self.grid_width - 1] = self.FREE_CELL
+            temporary_obstacle_grid[:, self.grid_width - 1] = self.FREE_CELL
             
         return temporary_obstacle_grid
     
+    def _find_path_cached(self, grid: np.ndarray, start: Tuple[int, int], end: Tuple[int, int], 
+                          diagonal_movement: int) -> Tuple[List, int]:
+        """
+        Find a path with the board's algorithm, reusing the result when the same search was already run on a grid 
+        with the same contents.
+
+        Parameters:
+            grid: The grid for pathfinding
+            start: The (column, row) to start from
+            end: The (column, row) to find a path to
+            diagonal_movement: When diagonal moves are allowed
+
+        Returns:
+            The path from start to end (empty if there isn't one), and the number of pathfinding runs
+        """
+        algorithm = self.board.algorithm
+        # The A* heuristic's scales are part of the search, breadth first search ignores them
+        scales = (None if algorithm == "breadth_first" 
+                  else (getattr(self, '_heuristic_dx_scale', 1.0), getattr(self, '_heuristic_dy_scale', 1.0)))
+        key = (grid.tobytes(), grid.shape, grid.dtype.str, tuple(start), tuple(end), algorithm, diagonal_movement, scales)
+
+        cached = self.path_cache.get(key)
+        if cached is not None:
+            path, runs = cached
+            return list(path), runs
+
+        if algorithm == "breadth_first":
+            path, runs = find_path_breadth_first(grid, start, end, diagonal_movement)
+        else:  # default to A*
+            path, runs = find_path(grid, start, end, diagonal_movement, heuristic=self.custom_heuristic)
+
+        # Each key holds a copy of the grid, so only keep the most recent searches
+        if len(self.path_cache) >= PATH_CACHE_SIZE:
+            del self.path_cache[next(iter(self.path_cache))]
+        self.path_cache[key] = (tuple(path), runs)
+        return path, runs
+
     def _route_socket_to_bus(self, grid: np.ndarray, socket_coordinate: Tuple[float, float], 
                                     bus_connection_coordinates: Point, net_name: str) -> List[Tuple[int, int, int]]:
         """
@@ -384,20 +422,11 @@ class BusRouter(Router):
             # sockets to the right of the bus target the left edge
             target_column_index = self.grid_width - 1 if socket_index[0] < bus_connection_index[0] else 0
         
-        # Create pathfinding grid
-        pathfinding_grid = Grid(matrix=current_grid, grid_id=0)
-        
-        # Set up the pathfinder
-        if self.board.algorithm == "breadth_first":
-            finder = BreadthFirstFinder()
-        else:  # default to A*
-            finder = AStarFinder(heuristic=self.custom_heuristic)
-        
         # Configure diagonal movement
         if self.board.allow_diagonal_traces:
-            finder.diagonal_movement = DiagonalMovement.only_when_no_obstacle
+            diagonal_movement = DiagonalMovement.only_when_no_obstacle
         else:
-            finder.diagonal_movement = DiagonalMovement.never
+            diagonal_movement = DiagonalMovement.never
         
         if self.debugger:
             self.debugger.log_event(
@@ -412,12 +441,13 @@ class BusRouter(Router):
             )
 
         # Find path
-        start = pathfinding_grid.node(socket_index[0], socket_index[1])
-        end = pathfinding_grid.node(target_column_index, bus_connection_index[1])
+        start = grid_point(current_grid, socket_index[0], socket_index[1])
+        end = grid_point(current_grid, target_column_index, bus_connection_index[1])
         
         try:
-            path, runs = finder.find_path(start, end, pathfinding_grid)
-            print(f"🔵 Pathfinding runs: {runs}")
+            path, runs = self._find_path_cached(current_grid, start, end, diagonal_movement)
+            if self.board.loader.debug:
+                print(f"🔵 Pathfinding runs: {runs}")
             
             if path:
                 if self.debugger:
@@ -478,7 +508,7 @@ class BusRouter(Router):
                 # Add a node exactly at the bus position if needed
                 if chopped_path[-1].x != bus_connection_index[0] or chopped_path[-1].y != bus_connection_index[1]:
                     # Create a new node at the exact bus position
-                    bus_node = pathfinding_grid.node(bus_connection_index[0], bus_connection_index[1])
+                    bus_node = grid_point(current_grid, bus_connection_index[0], bus_connection_index[1])
                     # Only add if it's adjacent to the last node
                     last_node = chopped_path[-1]
                     if abs(last_node.x - bus_connection_index[0]) <= 1 and abs(last_node.y - bus_connection_index[1]) <= 1:
@@ -567,8 +597,9 @@ class BusRouter(Router):
                         break
 
         # Print all zone sockets for debugging
-        for zone_center, sockets in zone_sockets.items():
-            print(f"Zone center: {zone_center}, Sockets: {sockets}")
+        if self.board.loader.debug:
+            for zone_center, sockets in zone_sockets.items():
+                print(f"Zone center: {zone_center}, Sockets: {sockets}")
         
         # Track which sockets have been added to groups
         added_sockets = set()
@@ -667,8 +698,9 @@ class BusRouter(Router):
             ordered_socket_groups[zone_center] = socket_groups[zone_center]
 
         # Print ordered socket groups for debugging
-        for zone_center, groups in ordered_socket_groups.items():
-            print(f"Ordered zone center: {zone_center}, Groups: {groups}")
+        if self.board.loader.debug:
+            for zone_center, groups in ordered_socket_groups.items():
+                print(f"Ordered zone center: {zone_center}, Groups: {groups}")
         
         return ordered_socket_groups
 
@@ -788,7 +820,8 @@ class BusRouter(Router):
                         self.debugger.log_event(f"Starting group {group_idx}: {len(socket_group)} sockets")
                     
                     # Process all sockets in the group
-                    print(f"Socket group length: {len(socket_group)}")
+                    if self.board.loader.debug:
+                        print(f"Socket group length: {len(socket_group)}")
                     while i < len(socket_group):
                         group_signature = tuple(
                             (entry[0], float(entry[1][0]), float(entry[1][1])) for entry in socket_group
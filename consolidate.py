@@ -1,7 +1,7 @@
+import os
 import csv
 from pathlib import Path
-from typing import List, Dict, Tuple
-import math
+from typing import List, Dict, Tuple, Optional
 
 from module import Module
 import thread_context
@@ -50,31 +50,37 @@ def consolidate_component_files(modules: List[Module], board_name: str, modules_
     # Track used reference prefixes to avoid duplicates
     used_refs = set()
     
+    # Each module's assembly directory is only scanned once, however many times the module is used
+    assembly_files = {}
+
+    # The CPL file of each module that has one, for the second pass
+    module_cpl_files = []
+    
     # First pass: collect all reference designators and assign unique ones
     for module_idx, module in enumerate(modules):
         module_path = modules_dir_path / f"{module.name}_{module.version}" / 'assembly'
         
+        if module_path not in assembly_files:
+            assembly_files[module_path] = find_assembly_files(module_path)
+        
         # Check if the module directory exists
-        if not module_path.exists() or not module_path.is_dir():
+        if assembly_files[module_path] is None:
             print(f"🔴 Module not found: {module_path}")
             continue
         
-        # Find BOM file for this module
-        bom_files = list(module_path.glob("BOM_*.csv"))
-        if not bom_files:
+        bom_file_path, cpl_file_path = assembly_files[module_path]
+        if cpl_file_path:
+            module_cpl_files.append((module_idx, module, cpl_file_path))
+        
+        # Both the BOM and CPL files are needed to collect references
+        if not bom_file_path:
             print(f"🟠 No BOM file found for module: {module.name}")
             continue
         
-        bom_file_path = bom_files[0]  # Use the first BOM file found
-        
-        # Find CPL file for this module
-        cpl_files = list(module_path.glob("CPL_*.csv"))
-        if not cpl_files:
+        if not cpl_file_path:
             print(f"🟠 No CPL file found for module: {module.name}")
             continue
         
-        cpl_file_path = cpl_files[0]  # Use the first CPL file found
-        
         # Process BOM file and collect references - using module_idx to ensure uniqueness
         collect_references(bom_file_path, cpl_file_path, module, ref_mapping, all_components, used_refs, module_idx)
     
@@ -82,18 +88,7 @@ def consolidate_component_files(modules: List[Module], board_name: str, modules_
     component_groups = group_components(all_components)
     
     # Second pass: Process CPL files with updated reference designators
-    for module_idx, module in enumerate(modules):
-        module_path = modules_dir_path / f"{module.name}_{module.version}" / 'assembly'
-        
-        if not module_path.exists() or not module_path.is_dir():
-            continue
-            
-        cpl_files = list(module_path.glob("CPL_*.csv"))
-        if not cpl_files:
-            continue
-            
-        cpl_file_path = cpl_files[0]
-        
+    for module_idx, module, cpl_file_path in module_cpl_files:
         # Process CPL file with updated references - using module_idx to match with first pass
         process_cpl_file(cpl_file_path, module, ref_mapping, cpl_entries, module_idx)
     
@@ -103,6 +98,33 @@ def consolidate_component_files(modules: List[Module], board_name: str, modules_
     # Write consolidated CPL to output file
     write_consolidated_cpl(cpl_entries, output_dir_path, board_name)
 
+def find_assembly_files(module_path: Path) -> Optional[Tuple[Optional[Path], Optional[Path]]]:
+    """
+    Finds a module's BOM and CPL files (the first 'BOM_*.csv' and 'CPL_*.csv') with a single scan of its directory.
+    
+    Parameters:
+        module_path (Path): The module's assembly directory.
+    
+    Returns:
+        Optional[Tuple[Optional[Path], Optional[Path]]]: The BOM and CPL file paths, either None if the file wasn't
+                                                         found, or None if the directory doesn't exist.
+    """
+    bom_file_path = None
+    cpl_file_path = None
+    try:
+        with os.scandir(module_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.csv'):
+                    continue
+                if bom_file_path is None and entry.name.startswith('BOM_'):
+                    bom_file_path = Path(entry.path)
+                elif cpl_file_path is None and entry.name.startswith('CPL_'):
+                    cpl_file_path = Path(entry.path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    
+    return bom_file_path, cpl_file_path
+
 def try_col_names(row: Dict, col_names: List[str]) -> str:
     """
     Tries to find a column in the row that matches any of the provided column names.
@@ -158,8 +180,12 @@ def collect_references(bom_file_path: Path, cpl_file_path: Path, module: Module,
         
         with open(cpl_file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
             reader = csv.DictReader(csvfile)
+            cpl_ref_col = None
             for row in reader:
-                designator = row.get(try_col_names(row, cpl_ref_col_names), "").strip()
+                # Every row has the same columns, so they're only matched on the first row
+                if cpl_ref_col is None:
+                    cpl_ref_col = try_col_names(row, cpl_ref_col_names)
+                designator = row.get(cpl_ref_col, "").strip()
                 if designator:
                     cpl_refs.add(designator) # Does this handle grouped?
                     cpl_data[designator] = row
@@ -175,13 +201,22 @@ def collect_references(bom_file_path: Path, cpl_file_path: Path, module: Module,
                 error(f"BOM file not in CSV format: {bom_file_path}")
                 return
             
+            # Every row has the same columns, so they're only matched on the first row
+            bom_value_col = None
+            bom_ref_col = None
+            module_name_version = f"{module.name}_{module.version}"
+            
             # Process each component
             for row in reader:
-                value = row.get(try_col_names(row, bom_value_col_names), "").strip()
+                if bom_value_col is None:
+                    bom_value_col = try_col_names(row, bom_value_col_names)
+                    bom_ref_col = try_col_names(row, bom_ref_col_names)
+                
+                value = row.get(bom_value_col, "").strip()
                 package = row.get("Package", "")
                 lcsc_part = row.get("LCSC Part", "").strip()
 
-                references = row.get(try_col_names(row, bom_ref_col_names), "").split(',')
+                references = row.get(bom_ref_col, "").split(',')
                 
                 # Process each reference designator
                 for ref in references:
@@ -195,24 +230,10 @@ def collect_references(bom_file_path: Path, cpl_file_path: Path, module: Module,
                     
                     # Create a unique key for this specific instance
                     # Include module_idx to handle duplicate modules
-                    module_name_version = f"{module.name}_{module.version}"
                     component_key = f"{module_idx}:{module_name_version}:{ref}"
 
                     # Generate a new unique reference designator
-                    # Extract the prefix (e.g., "R" from "R1") and number
-                    prefix = ''.join(c for c in ref if not c.isdigit())
-                    if not prefix:
-                        prefix = 'X'  # Fallback if no alphabetic prefix
-                    
-                    # Find a unique new reference
-                    counter = 1
-                    while True:
-                        new_ref = f"{prefix}{module_idx}{counter}"
-                        if new_ref not in used_refs:
-                            break
-                        counter += 1
-                    
-                    used_refs.add(new_ref)
+                    new_ref = unique_reference(ref, module_idx, used_refs)
                     ref_mapping[component_key] = new_ref
                     
                     # Store component data
@@ -231,6 +252,35 @@ def collect_references(bom_file_path: Path, cpl_file_path: Path, module: Module,
         error("Error collecting references from files: {e}")
 
 
+def unique_reference(ref: str, module_idx: int, used_refs: set) -> str:
+    """
+    Generates a new reference designator for a module's component, and adds it to the used references.
+    
+    Parameters:
+        ref (str): Original reference designator, e.g. "R1".
+        module_idx (int): Module index for prefix assignment.
+        used_refs (set): Set of already used reference designators.
+        
+    Returns:
+        str: The new unique reference designator.
+    """
+    # Extract the prefix (e.g., "R" from "R1") and number
+    prefix = ''.join(c for c in ref if not c.isdigit())
+    if not prefix:
+        prefix = 'X'  # Fallback if no alphabetic prefix
+    
+    # Find a unique new reference
+    counter = 1
+    while True:
+        new_ref = f"{prefix}{module_idx}{counter}"
+        if new_ref not in used_refs:
+            break
+        counter += 1
+    
+    used_refs.add(new_ref)
+    return new_ref
+
+
 def group_components(all_components: Dict) -> Dict:
     """
     Groups components with the same value and package to ensure consistent part numbers.
@@ -244,37 +294,22 @@ def group_components(all_components: Dict) -> Dict:
     # Dictionary to store component groups
     component_groups = {}
     
-    # First, group by value and package
-    value_package_groups = {}
-    
-    for comp_key, comp_data in all_components.items():
-        value = comp_data["Value"]
-        package = comp_data["Package"]
-        
-        group_key = f"{value}_{package}"
-        
-        if group_key not in value_package_groups:
-            value_package_groups[group_key] = []
-        
-        value_package_groups[group_key].append(comp_key)
-    
-    # For each group, use the first instance's LCSC Part number for all
-    for group_key, comp_keys in value_package_groups.items():
-        if not comp_keys:
-            continue
-        
-        # Use the first instance's part number
-        first_comp = all_components[comp_keys[0]]
-        lcsc_part = first_comp["LCSC Part"]
+    # Group by value and package in a single pass, using the first instance's LCSC Part number for all
+    for comp_data in all_components.values():
+        group_key = f"{comp_data['Value']}_{comp_data['Package']}"
         
-        # Create a group entry
-        component_groups[group_key] = {
-            "Value": first_comp["Value"],
-            "Package": first_comp["Package"],
-            "LCSC Part": lcsc_part,
-            "references": [all_components[key]["new_reference"] for key in comp_keys],
-            "fieldnames": first_comp["fieldnames"]
-        }
+        group = component_groups.get(group_key)
+        if group is None:
+            # Create a group entry from the first instance
+            component_groups[group_key] = {
+                "Value": comp_data["Value"],
+                "Package": comp_data["Package"],
+                "LCSC Part": comp_data["LCSC Part"],
+                "references": [comp_data["new_reference"]],
+                "fieldnames": comp_data["fieldnames"]
+            }
+        else:
+            group["references"].append(comp_data["new_reference"])
     
     return component_groups
 
@@ -306,6 +341,9 @@ def process_cpl_file(cpl_file_path: Path, module: Module, ref_mapping: Dict, cpl
                 print(f"🔴 Invalid CPL file format for: {cpl_file_path}")
                 return
             
+            # Key for looking up each component's new reference
+            module_name_version = f"{module.name}_{module.version}"
+            
             # Process each component
             for row in reader:
                 # Get the original values
@@ -314,7 +352,6 @@ def process_cpl_file(cpl_file_path: Path, module: Module, ref_mapping: Dict, cpl
                     continue
                 
                 # Generate the component key for lookup
-                module_name_version = f"{module.name}_{module.version}"
                 component_key = f"{module_idx}:{module_name_version}:{designator}"
                 
                 # Skip if this component doesn't have a mapped reference
@@ -330,10 +367,7 @@ def process_cpl_file(cpl_file_path: Path, module: Module, ref_mapping: Dict, cpl
                 rotation = float(row.get("Rot", 0))
                 
                 # Apply module rotation and position offset
-                new_x, new_y, new_rotation = transform_coordinates(
-                    mid_x, mid_y, rotation, 
-                    module.position.x, module.position.y, module.rotation
-                )
+                new_x, new_y, new_rotation = transform_coordinates(mid_x, mid_y, rotation, module)
                 
                 # Create a new row with transformed data and new designator
                 updated_row = row.copy()
@@ -352,7 +386,7 @@ def process_cpl_file(cpl_file_path: Path, module: Module, ref_mapping: Dict, cpl
         print(f"🔴 Error processing CPL file {cpl_file_path}: {e}")
 
 
-def transform_coordinates(x: float, y: float, rotation: float, offset_x: float, offset_y: float, module_rotation: float) -> Tuple[float, float, float]:
+def transform_coordinates(x: float, y: float, rotation: float, module: Module) -> Tuple[float, float, float]:
     """
     Transforms coordinates based on module position and rotation.
     Components are rotated around the module's center point.
@@ -361,20 +395,19 @@ def transform_coordinates(x: float, y: float, rotation: float, offset_x: float,
         x (float): Original X coordinate relative to module's center.
         y (float): Original Y coordinate relative to module's center.
         rotation (float): Original rotation in degrees.
-        offset_x (float): X offset for module position.
-        offset_y (float): Y offset for module position.
-        module_rotation (float): Module rotation in degrees.
+        module (Module): Module object containing position and rotation information.
     
     Returns:
         Tuple[float, float, float]: Transformed X, Y, and rotation.
     """
-    # Convert rotation to radians
-    module_rotation_rad = math.radians(-module_rotation)  # Negative to reverse rotation direction
+    # The module's cosine and sine are only computed once, rather than for every component
+    # NOTE: Module.affine uses the negative rotation angle, reversing the direction
+    cos_a, sin_a, offset_x, offset_y = module.affine
+    module_rotation = module.rotation
     
     # Rotate the component position around origin (module's center)
-    # Using negative rotation angle to reverse the direction
-    rotated_x = x * math.cos(module_rotation_rad) - y * math.sin(module_rotation_rad)
-    rotated_y = x * math.sin(module_rotation_rad) + y * math.cos(module_rotation_rad)
+    rotated_x = x * cos_a - y * sin_a
+    rotated_y = x * sin_a + y * cos_a
     
     # Add the module's position offset
     new_x = rotated_x + offset_x
@@ -393,7 +426,7 @@ def transform_coordinates(x: float, y: float, rotation: float, offset_x: float,
     return new_x, new_y, new_rotation
 
 
-def write_consolidated_bom(component_groups: Dict, output_dir_path: Path, board_name: str) -> None:
+def write_consolidated_bom(component_groups: Dict, output_dir_path: Path, board_name: str, out_filename: Optional[str] = None) -> None:
     """
     Writes the consolidated BOM components to a CSV file.
     Changes the 'Reference' column name to 'Designator' in the output file.
@@ -402,6 +435,7 @@ def write_consolidated_bom(component_groups: Dict, output_dir_path: Path, board_
         component_groups (Dict): Dictionary of grouped components.
         output_dir_path (Path): Output directory path.
         board_name (str): Name of the output board.
+        out_filename (str, optional): Output filename. Defaults to 'BOM_<board_name>.csv'.
     
     Returns:
         None
@@ -422,28 +456,23 @@ def write_consolidated_bom(component_groups: Dict, output_dir_path: Path, board_
         else:
             output_fieldnames.append(field)
     
-    output_file_path = output_dir_path / f"BOM_{board_name}.csv"
+    output_file_path = output_dir_path / (out_filename or f"BOM_{board_name}.csv")
+    
+    # Rows are generated as they're written, rather than building them all up front
+    # For Reference field, join the new unique references
+    rows = (
+        {
+            output_field: ','.join(component["references"]) if field == "Reference" else component.get(field, "")
+            for field, output_field in zip(fieldnames, output_fieldnames)
+        }
+        for component in component_groups.values()
+    )
     
     try:
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(output_file_path, 'w', buffering=1 << 20, newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=output_fieldnames)
             writer.writeheader()
-            
-            for component_key, component in component_groups.items():
-                # Create a row for this component
-                row = {}
-                for i, field in enumerate(fieldnames):
-                    output_field = output_fieldnames[i]
-                    
-                    if field == "Reference":
-                        # For Reference field, join the new unique references
-                        row[output_field] = ','.join(component["references"])
-                    elif field in component:
-                        row[output_field] = component[field]
-                    else:
-                        row[output_field] = ""
-                
-                writer.writerow(row)
+            writer.writerows(rows)
         
         print(f"🟢 Consolidated BOM written to: {output_file_path}")
     
@@ -451,7 +480,7 @@ def write_consolidated_bom(component_groups: Dict, output_dir_path: Path, board_
         print(f"🔴 Error writing consolidated BOM file: {e}")
 
 
-def write_consolidated_cpl(cpl_entries: Dict, output_dir_path: Path, board_name: str) -> None:
+def write_consolidated_cpl(cpl_entries: Dict, output_dir_path: Path, board_name: str, out_filename: Optional[str] = None) -> None:
     """
     Writes the consolidated CPL data to a CSV file.
 
@@ -459,6 +488,7 @@ def write_consolidated_cpl(cpl_entries: Dict, output_dir_path: Path, board_name:
         cpl_entries (Dict): Dictionary of CPL entries with new reference designators as keys.
         output_dir_path (Path): Output directory path.
         board_name (str): Name of the output board.
+        out_filename (str, optional): Output filename. Defaults to 'CPL_<board_name>-top-pos.csv'.
 
     Returns:
         None
@@ -482,27 +512,20 @@ def write_consolidated_cpl(cpl_entries: Dict, output_dir_path: Path, board_name:
     # List of new field names in order
     fieldnames = ["Designator", "Val", "Package", "Mid X", "Mid Y", "Rotation", "Layer"]
 
-    output_file_path = output_dir_path / f"CPL_{board_name}-top-pos.csv"
+    output_file_path = output_dir_path / (out_filename or f"CPL_{board_name}-top-pos.csv")
+
+    # Rows are generated as they're written, rather than building them all up front
+    # Each new row uses the mapping, copying over the old key's value (or an empty string if it's missing)
+    rows = (
+        {new_key: entry["row"].get(old_key, "") for old_key, new_key in old_to_new.items()}
+        for entry in cpl_entries.values()
+    )
 
     try:
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(output_file_path, 'w', buffering=1 << 20, newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
-
-            for _, entry in cpl_entries.items():
-                old_row = entry["row"]
-                # Create new row using the mapping, and defaulting to old key if not found
-                new_row = {}
-                for old_key, new_key in old_to_new.items():
-                    old_val = old_row.get(old_key, None)
-                    if old_val is not None:
-                        # Use the 'new' mapped key
-                        new_row[new_key] = old_val
-                    else:
-                        # Assume the old key is valid as-is, so copy it over
-                        new_row[new_key] = old_row.get(old_key, "")
-
-                writer.writerow(new_row)
+            writer.writerows(rows)
 
         print(f"🟢 Consolidated CPL written to: {output_file_path}")
 
@@ -1,11 +1,18 @@
+import io
 import math
+import contextlib
+import multiprocessing
 import numpy as np
-from collections import defaultdict
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pickle import PicklingError
 from typing import Dict, List, Tuple, Set, Optional, Any
-from pathfinding.core.grid import Grid
-from pathfinding.finder.a_star import AStarFinder
-from pathfinding.finder.breadth_first import BreadthFirstFinder
 from pathfinding.core.diagonal_movement import DiagonalMovement
+from pathfinding.core.heuristic import manhattan
+
+from grid_astar import find_path, find_path_breadth_first
+from router import block_zones
 
 from board import Board
 
@@ -13,6 +20,11 @@ from board import Board
 FREE_CELL = 1
 BLOCKED_CELL = 0
 
+# Starting worker processes costs around a second, since each one imports the modules again, so layers are only
+# routed in parallel when the layers other than the largest add up to more grid cells × searches than this
+# (roughly 5 s of searching)
+PARALLEL_LAYERS_MIN_WORK = 25_000_000
+
 class Point:
     """Represents a point in 2D space with x and y coordinates."""
     def __init__(self, x: float, y: float):
@@ -132,6 +144,35 @@ class RoutingResult:
     def __repr__(self) -> str:
         return f"RoutingResult(nets={len(self.nets)}, total_segments={self.total_segments_count()})"
 
+class UnionFind:
+    """Tracks which sockets of a net are already connected to each other, by socket ID."""
+    
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.rank = [0] * size
+        self.components = size
+
+    def find(self, node: int) -> int:
+        # Walk up to the root, then point every node on the way directly at it
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, node1: int, node2: int) -> None:
+        root1 = self.find(node1)
+        root2 = self.find(node2)
+        if root1 != root2:
+            self.components -= 1
+            if self.rank[root1] > self.rank[root2]:
+                self.parent[root2] = root1
+            else:
+                self.parent[root1] = root2
+                if self.rank[root1] == self.rank[root2]:
+                    self.rank[root2] += 1
+
 class Router:
     """
     A class for routing connections between sockets on a PCB.
@@ -149,6 +190,7 @@ class Router:
         self.resolution = board.resolution
         self.allow_diagonal_traces = board.allow_diagonal_traces
         self.algorithm = board.algorithm
+        self.debug = board.loader.debug  # Log every socket pair while routing
         self.dimensions = board.dimensions
         self.height = board.height
         self.width = board.width
@@ -161,12 +203,15 @@ class Router:
         
         # Will be populated during routing
         self.paths = {} 
-        self.previous_paths = defaultdict(list)  
+        self.previous_paths = {}  # Cells covered by paths routed so far, as a mask per layer
         self.result = RoutingResult()
         
         # Create the base grid
         self.base_grid = self._create_base_grid()
         
+        # Stamp every socket's keep-out zone once, rather than for every net
+        self.socket_margin_grid, self.socket_owners, self.socket_margins = self._stamp_socket_margins()
+        
         # Create net to layer mapping
         self.net_to_layer_map = self._invert_layer_map()
     
@@ -175,31 +220,11 @@ class Router:
         if not self.zones:
             raise ValueError("Cannot create grid without zones")
         
-        # Initialize grid with free cells
-        grid = np.full((self.grid_height, self.grid_width), FREE_CELL, dtype=int)
+        # Initialize grid with free cells, one byte each since cells are only ever free or blocked
+        grid = np.full((self.grid_height, self.grid_width), FREE_CELL, dtype=np.uint8)
         
         # Mark keep-out zones in the grid
-        for zone in self.zones.get_zone_rectangles():
-            bottom_left, top_left, top_right, bottom_right = zone
-            
-            # Convert coordinates to grid indices
-            bl_col, bl_row = self._to_grid_indices(bottom_left[0], bottom_left[1])
-            tr_col, tr_row = self._to_grid_indices(top_right[0], top_right[1])
-            
-            # Ensure bounds are within grid limits and handle coordinate flips
-            grid_width = grid.shape[1]
-            grid_height = grid.shape[0]
-            
-            bl_col = max(0, min(grid_width - 1, bl_col))
-            tr_col = max(0, min(grid_width - 1, tr_col))
-            bl_row = max(0, min(grid_height - 1, bl_row))
-            tr_row = max(0, min(grid_height - 1, tr_row))
-            
-            min_col, max_col = min(bl_col, tr_col), max(bl_col, tr_col)
-            min_row, max_row = min(bl_row, tr_row), max(bl_row, tr_row)
-            
-            # Mark cells in the rectangle as blocked
-            grid[min_row:max_row+1, min_col:max_col+1] = BLOCKED_CELL
+        block_zones(grid, self.zones.get_zone_rectangles(), self.grid_center_x, self.grid_center_y, self.resolution, BLOCKED_CELL)
         
         return grid
     
@@ -226,34 +251,64 @@ class Router:
         y = (self.grid_center_y - row) * self.resolution
         return Point(x, y)
     
-    def _apply_socket_margin(self, grid: np.ndarray, current_net: str, keep_out_mm: float = 1.0) -> np.ndarray:
-        """Apply keep-out zones around sockets of other nets."""
-        if not self.sockets:
-            return grid
+    def _stamp_socket_margins(self, keep_out_mm: float = 1.0) -> Tuple[np.ndarray, np.ndarray, Dict[str, Tuple[int, List[Tuple[slice, slice]]]]]:
+        """
+        Stamp the keep-out zones around every socket once, so each net only has to free its own sockets.
+        
+        Parameters:
+            keep_out_mm: Keep-out zone size in mm
             
-        temp_grid = np.copy(grid)
+        Returns:
+            The base grid with every socket's keep-out zone blocked, the index of the net whose socket was stamped 
+            last on each cell (-1 for none), and each net's index and keep-out zone slices
+        """
+        blocked_grid = np.copy(self.base_grid)
+        socket_owners = np.full(blocked_grid.shape, -1, dtype=np.int32)
+        net_margins = {}
+        if not self.sockets:
+            return blocked_grid, socket_owners, net_margins
+        
         keep_out_cells = int(np.ceil(keep_out_mm / self.resolution))
         socket_locations = self.sockets.get_socket_positions()
         
-        grid_height = grid.shape[0]
-        grid_width = grid.shape[1]
+        grid_height = blocked_grid.shape[0]
+        grid_width = blocked_grid.shape[1]
 
-        for net, locations in socket_locations.items():
+        for net_index, (net, locations) in enumerate(socket_locations.items()):
+            margins = []
             for x, y in locations:
                 x_index, y_index = self._to_grid_indices(x, y)
                 
-                # Apply keep-out zone around the socket
-                for i in range(-keep_out_cells+1, keep_out_cells):
-                    for j in range(-keep_out_cells+1, keep_out_cells):
-                        xi = x_index + i
-                        yi = y_index + j
-                        
-                        # Check if within grid boundaries
-                        if 0 <= xi < grid_width and 0 <= yi < grid_height:
-                            if net != current_net:
-                                temp_grid[yi, xi] = BLOCKED_CELL  # Block other nets
-                            else:
-                                temp_grid[yi, xi] = FREE_CELL  # Free for current net
+                # Keep-out zone around the socket, as a square slice clipped to the grid boundaries
+                min_x = max(0, x_index - keep_out_cells + 1)
+                max_x = min(grid_width, x_index + keep_out_cells)
+                min_y = max(0, y_index - keep_out_cells + 1)
+                max_y = min(grid_height, y_index + keep_out_cells)
+                if min_x >= max_x or min_y >= max_y:
+                    continue
+                
+                margin = (slice(min_y, max_y), slice(min_x, max_x))
+                blocked_grid[margin] = BLOCKED_CELL
+                socket_owners[margin] = net_index
+                margins.append(margin)
+            net_margins[net] = (net_index, margins)
+        
+        return blocked_grid, socket_owners, net_margins
+    
+    def _apply_socket_margin(self, current_net: str, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Apply keep-out zones around sockets of other nets, into out if given instead of a new grid."""
+        if out is None:
+            temp_grid = np.copy(self.socket_margin_grid)
+        else:
+            temp_grid = out
+            np.copyto(temp_grid, self.socket_margin_grid)
+        if current_net not in self.socket_margins:
+            return temp_grid
+        
+        # Free the current net's sockets, except where another net's socket was stamped over them
+        net_index, margins = self.socket_margins[current_net]
+        for margin in margins:
+            temp_grid[margin][self.socket_owners[margin] == net_index] = FREE_CELL
         
         return temp_grid
     
@@ -263,8 +318,8 @@ class Router:
         dy = abs(a[1] - b[1])
         return (dx + dy) + (math.sqrt(2) - 2) * min(dx, dy)
     
-    def _calculate_net_distances(self) -> Dict[str, List[Tuple[float, Tuple[float, float], Tuple[float, float]]]]:
-        """Calculate distances between sockets for each net and sort by distance."""
+    def _calculate_net_distances(self) -> Dict[str, List[Tuple[float, int, int]]]:
+        """Calculate distances between sockets for each net and sort by distance, as (distance, index, index) into the net's sockets."""
         if not self.sockets:
             return {}
             
@@ -272,19 +327,24 @@ class Router:
         net_distances = {}
         
         for net, locations in socket_locations.items():
-            distances = []
-            for i in range(len(locations) - 1):
-                for j in range(i + 1, len(locations)):
-                    loc_i = locations[i]
-                    loc_j = locations[j]
-                    # Scale by resolution for grid-based distance
-                    dist = self._heuristic_diagonal(
-                        (loc_i[0] / self.resolution, loc_i[1] / self.resolution),
-                        (loc_j[0] / self.resolution, loc_j[1] / self.resolution)
-                    )
-                    distances.append((dist, loc_i, loc_j))
-            distances.sort()  # Sort by distance
-            net_distances[net] = distances
+            if len(locations) < 2:
+                net_distances[net] = []
+                continue
+            
+            # Every pair of sockets, in the same order as a nested loop over i < j
+            coordinates = np.asarray(locations, dtype=np.float64)
+            i, j = np.triu_indices(len(locations), k=1)
+            
+            # Same as _heuristic_diagonal, scaled by resolution for grid-based distance, for all pairs at once
+            scaled = coordinates / self.resolution
+            dx = np.abs(scaled[i, 0] - scaled[j, 0])
+            dy = np.abs(scaled[i, 1] - scaled[j, 1])
+            dist = (dx + dy) + (math.sqrt(2) - 2) * np.minimum(dx, dy)
+            
+            # Sort by distance, breaking ties by the sockets' coordinates like sorting (dist, loc_i, loc_j) tuples
+            order = np.lexsort((coordinates[j, 1], coordinates[j, 0], coordinates[i, 1], coordinates[i, 0], dist))
+            dist_values, i_values, j_values = dist.tolist(), i.tolist(), j.tolist()
+            net_distances[net] = [(dist_values[k], i_values[k], j_values[k]) for k in order.tolist()]
             
         return net_distances
     
@@ -314,117 +374,198 @@ class Router:
                     segment = Segment(prev_point, curr_point)
                     net.add_segment(segment)
     
-    def route(self) -> RoutingResult:
-        """Route all nets on the board."""
-        if not self.sockets:
-            print("No sockets to route")
-            return self.result
-        
-        # Calculate distances between sockets for each net
-        net_distances = self._calculate_net_distances()
-        
-        # Get grid dimensions
-        grid_height = self.base_grid.shape[0]
-        grid_width = self.base_grid.shape[1]
+    def _route_nets(self, net_distances: Dict[str, List[Tuple[float, int, int]]],
+                    socket_locations: Dict[str, List[Tuple[float, float]]]) -> None:
+        """
+        Route nets one after the other, each blocked by the paths of the nets before it on the same layer.
+        Stores the paths in self.paths and self.previous_paths
         
-        class UnionFind:
-            def __init__(self, elements):
-                self.parent = {element: element for element in elements}
-                self.rank = {element: 0 for element in elements}
-
-            def find(self, element):
-                if self.parent[element] != element:
-                    self.parent[element] = self.find(self.parent[element])
-                return self.parent[element]
-
-            def union(self, element1, element2):
-                root1 = self.find(element1)
-                root2 = self.find(element2)
-                if root1 != root2:
-                    if self.rank[root1] > self.rank[root2]:
-                        self.parent[root2] = root1
-                    else:
-                        self.parent[root1] = root2
-                        if self.rank[root1] == self.rank[root2]:
-                            self.rank[root2] += 1
+        Parameters:
+            net_distances: Socket pairs of each net to route, sorted by distance
+            socket_locations: Socket locations of every net
+        """
+        # Configure diagonal movement
+        if self.allow_diagonal_traces:
+            diagonal_movement = DiagonalMovement.always
+        else:
+            diagonal_movement = DiagonalMovement.never
         
-        # Route each net
-        socket_locations = self.sockets.get_socket_positions()
+        # Every net is routed on the same buffer, refilled each time instead of allocating a new grid
+        net_matrix = np.empty_like(self.socket_margin_grid)
         for net, distances in net_distances.items():
             print(f"🟠 Routing net {net}")
             
             # Identify the layer for the current net
             current_layer = self.net_to_layer_map.get(net, None)
-            other_nets_on_layer = False
             
-            # Apply socket keep-out zones
-            current_matrix = self._apply_socket_margin(self.base_grid, net)
+            # The net's grid is only filled in once a pair actually needs a search, so nets with nothing to route
+            # (a single socket, or all sockets at one location) skip copying the whole grid
+            current_matrix = None
             
-            # Block previously routed paths on this layer
-            if self.previous_paths[current_layer]:
-                other_nets_on_layer = True
-                for path_indices in self.previous_paths[current_layer]:
-                    for (x_index, y_index, z_index) in path_indices:
-                        if 0 <= y_index < grid_height and 0 <= x_index < grid_width:
-                            current_matrix[y_index, x_index] = BLOCKED_CELL
+            # Union-Find to track connected sockets, with sockets at the same location sharing an ID
+            locations = socket_locations[net]
+            socket_ids = {}
+            ids = [socket_ids.setdefault(tuple(loc), len(socket_ids)) for loc in locations]
+            uf = UnionFind(len(socket_ids))
             
-            # Union-Find to track connected sockets
-            uf = UnionFind([tuple(loc) for loc in socket_locations[net]])
+            # Grid indices of every socket, converted once per net rather than for every pair
+            scaled = np.asarray(locations, dtype=np.float64).reshape(-1, 2) / self.resolution
+            columns = (self.grid_center_x + np.rint(scaled[:, 0])).astype(int).tolist()
+            rows = (self.grid_center_y - np.rint(scaled[:, 1])).astype(int).tolist()
+            grid_indices = list(zip(columns, rows))
             
             # Route each socket pair by distance
-            for dist, loc1, loc2 in distances:
-                print(f"🔵 Routing between {loc1} and {loc2}")
+            for dist, i, j in distances:
+                # Once every socket is connected the rest of the pairs would all be skipped, like Kruskal's algorithm
+                # stopping after a spanning tree's edges are found
+                if uf.components <= 1:
+                    print(f"🟢 All sockets of net {net} are connected")
+                    break
+                
+                loc1, loc2 = locations[i], locations[j]
+                if self.debug:
+                    print(f"🔵 Routing between {loc1} and {loc2}")
                 
-                # Skip if already connected
-                if uf.find(tuple(loc1)) == uf.find(tuple(loc2)):
-                    print(f"🟢 {loc1} and {loc2} are already connected")
+                # Skip if already connected, before any other work for this pair
+                if uf.find(ids[i]) == uf.find(ids[j]):
+                    if self.debug:
+                        print(f"🟢 {loc1} and {loc2} are already connected")
                     continue
                 
-                # Convert to grid indices
-                start_index = self._to_grid_indices(loc1[0], loc1[1])
-                end_index = self._to_grid_indices(loc2[0], loc2[1])
+                start_index = grid_indices[i]
+                end_index = grid_indices[j]
                 
-                # Create pathfinding grid
-                net_grid = Grid(matrix=current_matrix, grid_id=0)
+                if current_matrix is None:
+                    # Apply socket keep-out zones
+                    current_matrix = self._apply_socket_margin(net, out=net_matrix)
+                    
+                    # Block previously routed paths on this layer
+                    if current_layer in self.previous_paths:
+                        np.copyto(current_matrix, BLOCKED_CELL, where=self.previous_paths[current_layer])
                 
-                # Set up the pathfinder
+                # Find path
                 if self.algorithm == "breadth_first":
-                    finder = BreadthFirstFinder()
+                    path, runs = find_path_breadth_first(current_matrix, start_index, end_index, diagonal_movement)
                 else:  # default to A*
-                    finder = AStarFinder()
-                
-                # Configure diagonal movement
-                if self.allow_diagonal_traces:
-                    finder.diagonal_movement = DiagonalMovement.always
-                else:
-                    finder.diagonal_movement = DiagonalMovement.never
-                
-                # Find path
-                start = net_grid.node(*start_index)
-                end = net_grid.node(*end_index)
-                path, runs = finder.find_path(start, end, net_grid)
-                print(f"🔵 Pathfinding runs: {runs}")
+                    # NOTE: AStarFinder() picked the manhattan heuristic before diagonal movement was configured
+                    path, runs = find_path(current_matrix, start_index, end_index, diagonal_movement, heuristic=manhattan)
+                if self.debug:
+                    print(f"🔵 Pathfinding runs: {runs}")
                 
                 if path:
-                    print(f"🟢 Found path for net {net} between {loc1} and {loc2}")
+                    if self.debug:
+                        print(f"🟢 Found path for net {net} between {loc1} and {loc2}")
                     
                     # Convert path to tuples
                     path_tuples = [(node.x, node.y, 1) for node in path]
                     
                     # Store path
                     self.paths.setdefault(net, []).append(path_tuples)
-                    self.previous_paths[current_layer].append(path_tuples)
+                    if current_layer not in self.previous_paths:
+                        self.previous_paths[current_layer] = np.zeros(self.base_grid.shape, dtype=bool)
+                    cells = np.array(path_tuples, dtype=np.int32)
+                    self.previous_paths[current_layer][cells[:, 1], cells[:, 0]] = True
                     
                     # Mark as connected
-                    uf.union(tuple(loc1), tuple(loc2))
+                    uf.union(ids[i], ids[j])
                 else:
                     print(f"🔴 No path found for net {net} between {loc1} and {loc2}")
+    
+    def route(self) -> RoutingResult:
+        """Route all nets on the board."""
+        if not self.sockets:
+            print("No sockets to route")
+            return self.result
+        
+        # Calculate distances between sockets for each net
+        net_distances = self._calculate_net_distances()
+        
+        # Nets on different layers never block each other, so each layer is routed on its own
+        layer_net_distances = {}
+        for net, distances in net_distances.items():
+            layer_net_distances.setdefault(self.net_to_layer_map.get(net, None), {})[net] = distances
+        
+        socket_locations = self.sockets.get_socket_positions()
+        layer_results = None
+        if self._parallel_layers_worthwhile(layer_net_distances, socket_locations):
+            try:
+                with ProcessPoolExecutor(max_workers=len(layer_net_distances), mp_context=multiprocessing.get_context('spawn')) as executor:
+                    layer_results = list(executor.map(route_layer, repeat(self), layer_net_distances.values(), repeat(socket_locations), repeat(True)))
+            except (OSError, BrokenProcessPool, PicklingError) as error:
+                print(f"🟠 Couldn't route layers in worker processes, routing them one by one instead: {error}")
+        
+        if layer_results is None:
+            layer_results = [route_layer(self, distances, socket_locations) for distances in layer_net_distances.values()]
+        
+        # The workers' output is printed here, so it goes wherever this process' stdout currently goes
+        for _, _, output in layer_results:
+            if output:
+                print(output, end="")
+        
+        # Keep the paths in the order the nets were routed in
+        paths = {}
+        for layer_paths, layer_previous_paths, _ in layer_results:
+            paths.update(layer_paths)
+            self.previous_paths.update(layer_previous_paths)
+        self.paths = {net: paths[net] for net in net_distances if net in paths}
         
         # Convert paths to segments
         self._consolidate_segments()
     
         return self.result
     
+    def _parallel_layers_worthwhile(self, layer_net_distances: Dict[Optional[str], Dict[str, List[Tuple[float, int, int]]]],
+                                    socket_locations: Dict[str, List[Tuple[float, float]]]) -> bool:
+        """
+        Whether routing the layers in worker processes saves more time than starting them costs.
+        
+        Parameters:
+            layer_net_distances: Socket pairs of each net, grouped by layer
+            socket_locations: Socket locations of every net
+        
+        Returns:
+            True if the layers other than the largest need enough searching to cover the workers' start up
+        """
+        if len(layer_net_distances) < 2:
+            return False
+        
+        # A net of n sockets needs at most n - 1 searches, each over at most the whole grid
+        layer_work = sorted(
+            self.base_grid.size * sum(max(len(socket_locations.get(net, ())) - 1, 0) for net in nets)
+            for nets in layer_net_distances.values()
+        )
+        return sum(layer_work[:-1]) >= PARALLEL_LAYERS_MIN_WORK
+    
     def get_routing_result(self) -> RoutingResult:
         """Get the routing result"""
-        return self.result
\ No newline at end of file
+        return self.result
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """Leave out the board when sent to a worker process, routing only needs the grids"""
+        state = self.__dict__.copy()
+        state["board"] = state["sockets"] = state["zones"] = None
+        return state
+
+def route_layer(router: Router, net_distances: Dict[str, List[Tuple[float, int, int]]],
+                socket_locations: Dict[str, List[Tuple[float, float]]],
+                capture_output: bool = False) -> Tuple[Dict[str, List[List[Tuple[int, int, int]]]], Dict[Optional[str], np.ndarray], str]:
+    """
+    Route the nets of one layer, in a worker process or in this one.
+    
+    Parameters:
+        router: The router, with no paths routed on this layer yet
+        net_distances: Socket pairs of each net on the layer, sorted by distance
+        socket_locations: Socket locations of every net
+        capture_output: Whether to collect the printed output instead of printing it, for worker processes
+    
+    Returns:
+        The paths of each net, the mask of cells covered by them on the layer, and the captured output
+    """
+    if not capture_output:
+        router._route_nets(net_distances, socket_locations)
+        return router.paths, router.previous_paths, ""
+    
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        router._route_nets(net_distances, socket_locations)
+    return router.paths, router.previous_paths, output.getvalue()
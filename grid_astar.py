@@ -0,0 +1,252 @@
+import math
+import heapq
+from collections import deque
+from array import array
+import numpy as np
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from pathfinding.core.diagonal_movement import DiagonalMovement
+from pathfinding.core.heuristic import manhattan, octile
+
+SQRT2 = math.sqrt(2)
+
+class GridPoint(NamedTuple):
+    """A cell on the path, with the same .x and .y as python-pathfinding's GridNode"""
+    x: int
+    y: int
+
+def grid_point(matrix: np.ndarray, x: int, y: int) -> GridPoint:
+    """
+    Looks up a cell the same way as python-pathfinding's Grid.node(x, y), which indexes lists: an IndexError outside 
+    the grid, and negative indices count back from the end.
+
+    Parameters:
+        matrix: The grid
+        x: The column
+        y: The row
+
+    Returns:
+        The cell, with non-negative indices
+    """
+    height, width = matrix.shape
+    return GridPoint(range(width)[x], range(height)[y])
+
+def padded_weights(matrix: np.ndarray) -> Tuple[int, np.ndarray]:
+    """
+    Numbers the cells row by row on the grid padded with a border of obstacles, so a neighbour is a fixed offset
+    from its cell and never needs a bounds check.
+
+    Parameters:
+        matrix: The grid
+
+    Returns:
+        The length of a padded row, and the flat padded grid as floats
+    """
+    height, width = matrix.shape
+    row = width + 2
+    padded = np.zeros((height + 2, row), dtype=np.float64)
+    padded[1:-1, 1:-1] = matrix
+    return row, padded.ravel()
+
+def neighbour_cells(index: int, row: int, walkable: bytes, diagonal_movement: int) -> List[Tuple[int, float]]:
+    """
+    Finds the walkable neighbours of a padded cell, in python-pathfinding's order: ↑ → ↓ ←, then ↖ ↗ ↘ ↙.
+
+    Parameters:
+        index: The padded cell
+        row: The length of a padded row
+        walkable: Whether each padded cell is walkable
+        diagonal_movement: When diagonal moves are allowed, as in python-pathfinding
+
+    Returns:
+        Each neighbouring cell with the distance to it
+    """
+    up, right, down, left = index - row, index + 1, index + row, index - 1
+    up_free, right_free, down_free, left_free = walkable[up], walkable[right], walkable[down], walkable[left]
+    neighbours = []
+    if up_free:
+        neighbours.append((up, 1))
+    if right_free:
+        neighbours.append((right, 1))
+    if down_free:
+        neighbours.append((down, 1))
+    if left_free:
+        neighbours.append((left, 1))
+
+    if diagonal_movement == DiagonalMovement.never:
+        return neighbours
+
+    # Whether each diagonal may pass between the two orthogonal neighbours next to it
+    if diagonal_movement == DiagonalMovement.only_when_no_obstacle:
+        up_left, up_right = up_free and left_free, up_free and right_free
+        down_right, down_left = down_free and right_free, down_free and left_free
+    elif diagonal_movement == DiagonalMovement.if_at_most_one_obstacle:
+        up_left, up_right = up_free or left_free, up_free or right_free
+        down_right, down_left = down_free or right_free, down_free or left_free
+    else:
+        up_left = up_right = down_right = down_left = True
+
+    if up_left and walkable[up - 1]:
+        neighbours.append((up - 1, SQRT2))
+    if up_right and walkable[up + 1]:
+        neighbours.append((up + 1, SQRT2))
+    if down_right and walkable[down + 1]:
+        neighbours.append((down + 1, SQRT2))
+    if down_left and walkable[down - 1]:
+        neighbours.append((down - 1, SQRT2))
+    return neighbours
+
+def trace_path(index: int, parent: List[int], row: int) -> List[GridPoint]:
+    """
+    Follows the parents of a padded cell back to the start.
+
+    Parameters:
+        index: The padded cell the path ends at
+        parent: The parent of each padded cell, or -1 for the start
+        row: The length of a padded row
+
+    Returns:
+        The path from the start to the cell (including both)
+    """
+    path = []
+    while index != -1:
+        y, x = divmod(index, row)
+        path.append(GridPoint(x - 1, y - 1))
+        index = parent[index]
+    path.reverse()
+    return path
+
+def find_path(matrix: np.ndarray, start: Tuple[int, int], end: Tuple[int, int],
+              diagonal_movement: int = DiagonalMovement.never,
+              heuristic: Optional[Callable[[int, int], float]] = None) -> Tuple[List[GridPoint], int]:
+    """
+    Finds a path with A*, giving exactly the same path and number of runs as python-pathfinding's AStarFinder on
+    Grid(matrix=matrix), without building a GridNode object for every cell of the grid on every search.
+
+    NOTE: This deliberately mirrors the library's behaviour so routing results don't change, including how it 
+    "removes" a node's outdated open list entry: by its new f value, which only matches when the f value didn't 
+    change, otherwise the outdated entry is popped and expanded again later.
+
+    Parameters:
+        matrix: The grid, where values above 0 are walkable with that weight, and anything else is an obstacle
+        start: The (column, row) to start from
+        end: The (column, row) to find a path to
+        diagonal_movement: When diagonal moves are allowed, as in python-pathfinding
+        heuristic: Heuristic for the remaining cost from (dx, dy), defaults to manhattan or octile like the library
+
+    Returns:
+        The path from start to end (including both), or an empty list if there isn't one, and the number of runs
+    """
+    if heuristic is None:
+        heuristic = manhattan if diagonal_movement == DiagonalMovement.never else octile
+
+    row, weights = padded_weights(matrix)
+    positive = weights > 0
+    # The heuristic is scaled by the lowest weight, so it never overestimates
+    min_weight = float(weights[positive].min()) if positive.any() else math.inf
+    # Copied straight from the arrays' buffers rather than creating a Python object for every cell
+    walkable = positive.tobytes()
+    weights = array('d', weights.tobytes())
+
+    cell_count = len(weights)
+    g = [0.0] * cell_count
+    h = [0.0] * cell_count
+    parent = [-1] * cell_count
+    push_order = [0] * cell_count
+    opened = bytearray(cell_count)
+    closed = bytearray(cell_count)
+
+    start_x, start_y = grid_point(matrix, *start)
+    end_x, end_y = grid_point(matrix, *end)
+    start_index = (start_y + 1) * row + start_x + 1
+    end_index = (end_y + 1) * row + end_x + 1
+    opened[start_index] = 1
+
+    # Entries are (f, push order, cell): push orders are unique, so ties are broken by push order the same way as
+    # the library's (f, push order, node) entries without ever comparing further
+    open_list = [(0, 0, start_index)]
+    removed = set()
+    pushed = 0
+    runs = 0
+
+    while open_list:
+        runs += 1
+        entry = heapq.heappop(open_list)
+        while entry in removed:
+            entry = heapq.heappop(open_list)
+        index = entry[2]
+        closed[index] = 1
+
+        if index == end_index:
+            return trace_path(index, parent, row), runs
+
+        for neighbour, distance in neighbour_cells(index, row, walkable, diagonal_movement):
+            if closed[neighbour]:
+                continue
+
+            # Cost from the start through the current node, weighted by the neighbour's cell value
+            neighbour_g = g[index] + distance * weights[neighbour]
+            if not opened[neighbour] or neighbour_g < g[neighbour]:
+                g[neighbour] = neighbour_g
+                if not h[neighbour]:
+                    neighbour_y, neighbour_x = divmod(neighbour, row)
+                    h[neighbour] = heuristic(abs(neighbour_x - 1 - end_x), abs(neighbour_y - 1 - end_y)) * min_weight
+                f = neighbour_g + h[neighbour]
+                parent[neighbour] = index
+                if opened[neighbour]:
+                    removed.add((f, push_order[neighbour], neighbour))
+                opened[neighbour] = 1
+                pushed += 1
+                push_order[neighbour] = pushed
+                heapq.heappush(open_list, (f, pushed, neighbour))
+
+    # Failed to find a path
+    return [], runs
+
+def find_path_breadth_first(matrix: np.ndarray, start: Tuple[int, int], end: Tuple[int, int],
+                            diagonal_movement: int = DiagonalMovement.never) -> Tuple[List[GridPoint], int]:
+    """
+    Finds a path with breadth first search, giving exactly the same path and number of runs as python-pathfinding's
+    BreadthFirstFinder on Grid(matrix=matrix). The library keeps its open list in a heap where every f is 0, so it 
+    visits nodes in the order they were pushed, which is a plain queue here.
+
+    Parameters:
+        matrix: The grid, where values above 0 are walkable, and anything else is an obstacle
+        start: The (column, row) to start from
+        end: The (column, row) to find a path to
+        diagonal_movement: When diagonal moves are allowed, as in python-pathfinding
+
+    Returns:
+        The path from start to end (including both), or an empty list if there isn't one, and the number of runs
+    """
+    row, weights = padded_weights(matrix)
+    walkable = (weights > 0).tobytes()
+    parent = [-1] * len(weights)
+    # Cells that were ever queued, which also covers the ones already visited
+    opened = bytearray(len(weights))
+
+    start_x, start_y = grid_point(matrix, *start)
+    end_x, end_y = grid_point(matrix, *end)
+    start_index = (start_y + 1) * row + start_x + 1
+    end_index = (end_y + 1) * row + end_x + 1
+    opened[start_index] = 1
+
+    queue = deque((start_index,))
+    runs = 0
+
+    while queue:
+        runs += 1
+        index = queue.popleft()
+
+        if index == end_index:
+            return trace_path(index, parent, row), runs
+
+        for neighbour, _ in neighbour_cells(index, row, walkable, diagonal_movement):
+            if opened[neighbour]:
+                continue
+
+            queue.append(neighbour)
+            opened[neighbour] = 1
+            parent[neighbour] = index
+
+    # Failed to find a path
+    return [], runs
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def consolidate_segments(routes, resolution, center_x, center_y):
     """
@@ -42,44 +43,21 @@ def consolidate_segments(routes, resolution, center_x, center_y):
             if len(path) < 2:
                 continue
 
-            # current_segment_start is the first node
-            current_segment_start = path[0]
-            # Compute the initial direction & z
-            prev_row, prev_col, prev_z = current_segment_start
-            current_direction = None  # We'll set it on first comparison
-
-            # Walk the path
-            for i in range(1, len(path)):
-                row, col, z = path[i]
-                
-                # Compare direction to the previous node
-                direction = (row - prev_row, col - prev_col)
-
-                # If direction changes or z changes, we end the old segment here
-                if current_direction is None:
-                    # first step
-                    current_direction = direction
-                if direction != current_direction or z != prev_z:
-                    # finish the old segment
-                    store_segment(
-                        consolidated_routes, net,
-                        current_segment_start, path[i - 1],
-                        resolution, center_x, center_y
-                    )
-                    # start a new segment at the old point
-                    current_segment_start = path[i - 1]
-                    current_direction = direction
-
-                # Update loop variables
-                prev_row, prev_col, prev_z = row, col, z
-
-                # If this is the last node, close out the segment
-                if i == len(path) - 1:
-                    store_segment(
-                        consolidated_routes, net,
-                        current_segment_start, path[i],
-                        resolution, center_x, center_y
-                    )
+            nodes = np.asarray(path)
+            steps = np.diff(nodes[:, :2], axis=0)
+
+            # A segment ends at the node before a step where the z changes, or the direction changes (from the 
+            # second step on), the same as walking the path node by node
+            breaks = nodes[1:, 2] != nodes[:-1, 2]
+            breaks[1:] |= np.any(steps[1:] != steps[:-1], axis=1)
+            ends = [0] + np.flatnonzero(breaks).tolist() + [len(path) - 1]
+
+            for start, end in zip(ends, ends[1:]):
+                store_segment(
+                    consolidated_routes, net,
+                    path[start], path[end],
+                    resolution, center_x, center_y
+                )
 
     return consolidated_routes
 
@@ -1,4 +1,6 @@
 from typing import Tuple, Optional
+from functools import cached_property
+import math
 
 class Position:
     """
@@ -27,6 +29,21 @@ class Module:
         # (bottom_left, top_left, top_right, bottom_right)
         self.zone: Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float], Tuple[float, float]] = None 
     
+    @cached_property
+    def rotation_radians(self) -> float:
+        """The module's rotation in radians"""
+        return math.radians(self.rotation)
+
+    @cached_property
+    def affine(self) -> Tuple[float, float, float, float]:
+        """
+        The module's rotation and position as (cos, sin, dx, dy), which moves a point (x, y) in the module's 
+        files to (x * cos - y * sin + dx, x * sin + y * cos + dy), in mm.
+        NOTE: Rotation is clockwise, the same as gerbonara's .rotate()
+        """
+        angle = -self.rotation_radians
+        return (math.cos(angle), math.sin(angle), self.position.x, self.position.y)
+
     def set_zone(self, p1: tuple[float, float], p2: tuple[float, float], 
              p3: tuple[float, float], p4: tuple[float, float]) -> None:
         """
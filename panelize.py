@@ -3,7 +3,7 @@ import thread_context
 
 # from process import merge_layers
 # from process import merge_stacks
-from consolidate import collect_references, process_cpl_file, group_components, write_consolidated_bom, write_consolidated_cpl
+from consolidate import collect_references, unique_reference, group_components, write_consolidated_bom, write_consolidated_cpl
 from process import compress_directory
 from gerber_writer import DataLayer, Path as GPath, Rectangle
 from step_repeat import insert_sr_placeholders, replace_sr_placeholders
@@ -12,17 +12,46 @@ from step_repeat import insert_sr_placeholders, replace_sr_placeholders
 # such as "Conductor" and "Soldermask,L1,Top,Signal".
 from gerbonara import GerberFile, ExcellonFile
 import warnings
+import numpy as np
 
 import os
 import sys
+import csv
+import copy
 import math
+import shutil
+import hashlib
 import subprocess
+import time
 from datetime import datetime
+from functools import lru_cache
+from importlib import metadata
+from concurrent.futures import ThreadPoolExecutor
 
 from server_packets_panelize import PanelizeStartRequest
 
 from module import Module
 
+# Flattened SVG output is cached by content hash, so re-panelizing the same board skips svg-flatten
+# NOTE: Lives next to ./storage/jobs, which is the persistent storage folder in the docker container
+svg_flatten_cache_dir = Path("./storage/cache/svg_flatten")
+# Least recently used entries are removed once the cache is larger than this, or when they haven't been used for this long
+svg_flatten_cache_max_bytes = 512 * 1024 * 1024
+svg_flatten_cache_max_age = 30 * 24 * 60 * 60
+
+# Protel extension for each layer, by the name gerbonara gives it (not required, but might help with layer identification)
+protel_extensions = (
+    ("copper_top", ".GTL"),
+    ("copper_bottom", ".GBL"),
+    ("soldermask_top", ".GTS"),
+    ("soldermask_bottom", ".GBS"),
+    ("silkscreen_top", ".GTO"),
+    ("silkscreen_bottom", ".GBO"),
+    ("outline_all", ".GM1"),
+    ("solderpaste_top", ".GTP"),
+    ("solderpaste_bottom", ".GBP"),
+)
+
 def progress(value: float):
     progress_file = thread_context.job_folder / "progress.txt"
     with open(progress_file, 'w') as file:
@@ -46,14 +75,14 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
 
     thread_context.job_id = job_id
     thread_context.job_folder = Path(job_folder)
+    job_folder = thread_context.job_folder
 
-    # The Gerber layers we'd like to step, repeat and merge
-    repeat_folder = thread_context.job_folder / "repeat_gerbers"
-    os.makedirs(repeat_folder, exist_ok=True)
-
-    # Output folder for merged gerbers
-    output_folder = thread_context.job_folder / "output"
-    os.makedirs(output_folder, exist_ok=True)
+    repeat_folder = job_folder / "repeat_gerbers"       # The Gerber layers we'd like to step, repeat and merge
+    output_folder = job_folder / "output"               # Output folder for merged gerbers
+    assembly_folder = job_folder / "assembly"           # BOM and placement files
+    panel_folder = job_folder / "panel"                 # Panel infrastructure elements (rather than user board elements)
+    for folder in (repeat_folder, output_folder, assembly_folder, panel_folder):
+        folder.mkdir(parents=True, exist_ok=True)
 
     count = data["fabSpec"]["count"]
     step = data["fabSpec"]["step"]
@@ -65,9 +94,6 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
 
 
     # Save BOM and placement files to ./assembly
-    assembly_folder = thread_context.job_folder / "assembly"
-    os.makedirs(assembly_folder, exist_ok=True)
-
     # Find fileTextLayers for BOM and placement
     bom_layer = next((layer for layer in data["fileTextLayers"] if layer["layer"]["type"] == "bom"), None)
     placement_layer = next((layer for layer in data["fileTextLayers"] if layer["layer"]["type"] == "placement"), None)
@@ -108,6 +134,17 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
             return failed
 
 
+    # Layers stepped and repeated by gerbonara are kept in memory until the panel layers are merged in,
+    # so each of them is only saved once
+    output_layers = {}
+
+    # Offset of every board in the panel, row by row, for layers stepped and repeated by gerbonara
+    dx = np.arange(int(count["x"]), dtype=float) * step["x"]
+    dy = -np.arange(int(count["y"]), dtype=float) * step["y"]  # Invert Y axis
+    board_offsets = np.stack(np.meshgrid(dx, dy), -1).reshape(-1, 2)
+    if not use_sr_command: # SR preserves origin, so don't offset drills in this case
+        board_offsets += [gerber_origin["x"], -gerber_origin["y"]]
+
     # Step, repeat and merge each Gerber and drill layer
     layer_count = len(data["fileTextLayers"])
     for layer_index in range(layer_count):
@@ -152,52 +189,30 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
                 # Step, repeat and merge the layer in gerbers_folder using gerbonara
                 source = GerberFile.open(source_path) if type != "drill" else ExcellonFile.open(source_path)
 
-                if not use_sr_command: # SR preserves origin, so don't offset drills in this case
-                    source.offset(gerber_origin["x"], -gerber_origin["y"]) # NOTE: Works with floats despite saying int, don't round it
-
-                source.save(target_path)
-
                 print(f"🔵 Stepping and repeating {layer_filename} using gerbonara...")
 
-                target = GerberFile.open(target_path) if type != "drill" else ExcellonFile.open(target_path)
-
                 progress( 0.9 * (layer_index / layer_count))
-                for i in range(1, int(count["x"])):
-                    dx = i * step["x"]
-                    source.offset(dx, 0) # NOTE: Works with floats despite saying int, don't round it
-                    target = GerberFile.open(target_path) if type != "drill" else ExcellonFile.open(target_path)
-                    target.merge(source)
-                    target.save(target_path) # Save is super slow
-                    source.offset(-dx, 0)  # Reset position
-
-                # Open target as source now to draw whole rows at once for massive speedup
-                source = GerberFile.open(target_path) if type != "drill" else ExcellonFile.open(target_path)
-                for j in range(1, int(count["y"])):
-                    dy = -j * step["y"]  # Invert Y axis
-                    source.offset(0, dy) # NOTE: Works with floats despite saying int, don't round it
-                    target = GerberFile.open(target_path) if type != "drill" else ExcellonFile.open(target_path)
-                    target.merge(source)
-                    target.save(target_path) # Save is super slow
-                    source.offset(0, -dy)  # Reset position
+                board_objects = source.objects
+                source.objects = []
+                target = LayerAccumulator(source)
+                target.add_offset_copies(board_objects, board_offsets)
+
+                output_layers[layer_filename] = target.layer
 
 
     progress(0.9)
     # Write start request data to files in the job folder
-    with open(thread_context.job_folder / "copperTop.svg", 'w') as file:
+    with open(job_folder / "copperTop.svg", 'w') as file:
         file.write(data["svgCopperTop"])
-    with open(thread_context.job_folder / "copperBot.svg", 'w') as file:
+    with open(job_folder / "copperBot.svg", 'w') as file:
         file.write(data["svgCopperBottom"])
-    with open(thread_context.job_folder / "soldermaskTop.svg", 'w') as file:
+    with open(job_folder / "soldermaskTop.svg", 'w') as file:
         file.write(data["soldermaskTop"])
-    with open(thread_context.job_folder / "soldermaskBottom.svg", 'w') as file:
+    with open(job_folder / "soldermaskBottom.svg", 'w') as file:
         file.write(data["soldermaskBottom"])
-    with open(thread_context.job_folder / "vcut.svg", 'w') as file:
+    with open(job_folder / "vcut.svg", 'w') as file:
         file.write(data["vcut"])
 
-    # Make folder for panel infrastructure elements (rather than user board elements)
-    panel_folder = thread_context.job_folder / "panel"
-    os.makedirs(panel_folder, exist_ok=True)
-
     # Remove venv paths from PATH to access svg-flatten (svg-flatten is setup at system level, not in venv)
     env = os.environ.copy()
     venv_bin = sys.prefix + "/bin"
@@ -209,20 +224,15 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
     # NOTE: The gerber-outline format is more likely to make 'line' and 'spot_circle' objects
     # instead of 'polygon' objects which fab houses treat like copper fills. 
     # I don't think gerber-outline can make polygons at all actually.
-    subprocess.run(["wasi-svg-flatten", "--format", "gerber-outline", "copperTop.svg", "panel/copper_top.gbr"],
-               cwd=thread_context.job_folder, env=env)
-    subprocess.run(["wasi-svg-flatten", "--format", "gerber-outline", "copperBot.svg", "panel/copper_bottom.gbr"],
-                cwd=thread_context.job_folder, env=env)
+    svg_flatten("copperTop.svg", "panel/copper_top.gbr", env, "gerber-outline")
+    svg_flatten("copperBot.svg", "panel/copper_bottom.gbr", env, "gerber-outline")
     # NOTE: Use of gerber-outline means we can't have rectangular pad soldermask openings, 
     # they'll just become lines with rounded edges
-    subprocess.run(["wasi-svg-flatten", "--format", "gerber-outline", "soldermaskTop.svg", "panel/soldermask_top.gbr"],
-                cwd=thread_context.job_folder, env=env)
+    svg_flatten("soldermaskTop.svg", "panel/soldermask_top.gbr", env, "gerber-outline")
     progress(0.99)
-    subprocess.run(["wasi-svg-flatten", "--format", "gerber-outline", "soldermaskBottom.svg", "panel/soldermask_bottom.gbr"],
-                cwd=thread_context.job_folder, env=env)
+    svg_flatten("soldermaskBottom.svg", "panel/soldermask_bottom.gbr", env, "gerber-outline")
 
-    subprocess.run(["wasi-svg-flatten", "vcut.svg", "panel/vcut_all.gbr"],
-                cwd=thread_context.job_folder, env=env)
+    svg_flatten("vcut.svg", "panel/vcut_all.gbr", env)
 
 
     # Use gerber-writer to add rectangular pad copper and soldermask
@@ -249,23 +259,20 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
         mask_top.add_pad(rect, center)
         mask_bot.add_pad(rect, center)
 
-    # Write the Gerber files
+    # Panel layers are kept in memory (keyed by output filename) until they're merged into the output
+    panel_layers = {}
+
+    # Merge the pads into the flattened SVG layers
     # NOTE: Pads are done seperately from SVG flattening because we want a spot_rect, not polygon
-    panel_pads_folder = thread_context.job_folder / "panel_pads"
-    os.makedirs(panel_pads_folder, exist_ok=True)
-
-    file_path = os.path.join(panel_pads_folder, "copper_top.gbr")
-    with open(file_path, 'w') as file:
-        file.write(top.dumps_gerber())
-    file_path = os.path.join(panel_pads_folder, "copper_bottom.gbr")
-    with open(file_path, 'w') as file:
-        file.write(bot.dumps_gerber())
-    file_path = os.path.join(panel_pads_folder, "soldermask_top.gbr")
-    with open(file_path, 'w') as file:
-        file.write(mask_top.dumps_gerber())
-    file_path = os.path.join(panel_pads_folder, "soldermask_bottom.gbr")
-    with open(file_path, 'w') as file:
-        file.write(mask_bot.dumps_gerber())
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        for layer_filename, pads_layer in [("copper_top.gbr", top), ("copper_bottom.gbr", bot), 
+                                           ("soldermask_top.gbr", mask_top), ("soldermask_bottom.gbr", mask_bot)]:
+            print(f"🔵 Merging pad layer: {layer_filename}...")
+            panel_layer = GerberFile.open(panel_folder / layer_filename)
+            panel_layer.merge(GerberFile.from_string(pads_layer.dumps_gerber()))
+            panel_layers[layer_filename] = panel_layer
 
 
     # Use gerber-writer to add board outline
@@ -300,40 +307,7 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
             y = -float(commands[i + 7])
 
             # TODO: Calculate center of the arc (assuming rx == ry and no rotation)
-
-            x1, y1 = current_pos
-            x2, y2 = x, y
-            r = rx
-
-            dx = x2 - x1
-            dy = y2 - y1
-            d = math.hypot(dx, dy)
-
-            # midpoint
-            mx = (x1 + x2) / 2
-            my = (y1 + y2) / 2
-
-            # distance from midpoint to center
-            h = math.sqrt(max(r*r - (d/2)*(d/2), 0))
-
-            # perpendicular unit vector
-            px = -dy / d
-            py = dx / d
-
-            # two possible centers
-            cx1 = mx + px * h
-            cy1 = my + py * h
-            cx2 = mx - px * h
-            cy2 = my - py * h
-
-            # choose based on sweep flag
-            def is_clockwise(cx, cy):
-                return (x1 - cx)*(y2 - cy) - (y1 - cy)*(x2 - cx) < 0
-
-            if sweep_flag == 1:  # clockwise
-                cx, cy = (cx1, cy1) if is_clockwise(cx1, cy1) else (cx2, cy2)
-            else:                # counter-clockwise
-                cx, cy = (cx2, cy2) if is_clockwise(cx1, cy1) else (cx1, cy1)
+            cx, cy = arc_center(current_pos, (x, y), rx, sweep_flag)
 
             # Takes end point, center point, and direction
             path_copper.arcto((x, y), (cx, cy), '-' if sweep_flag == 1 else '+')
@@ -346,17 +320,20 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
     outline_layer = DataLayer("Outline,EdgeCuts", negative=False)
     outline_layer.add_traces_path(path_copper, 0.15, 'Outline')
     
-    # Write the Gerber file
-    file_path = os.path.join(panel_folder, "outline_all.gbr")
-    with open(file_path, 'w') as file:
-        file.write(outline_layer.dumps_gerber())
+    # Put vcut on board outline layer (JLC requirement), merging into the in-memory outline so it's only saved once
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        outline = GerberFile.from_string(outline_layer.dumps_gerber())
+        outline.merge(GerberFile.open(panel_folder / "vcut_all.gbr"))
+        panel_layers["outline_all.gbr"] = outline
 
     # Make via and bite holes (copper's already there for vias)
     via_hole_diameter = data["fabSpec"]["viaHoleDiameter"]
     
     # Drill file content
     timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%S%z")
-    content = [
+    pth_header = [
         "M48",
         f"; DRILL file SmartPanelizer date {timestamp}",
         "; FORMAT={-:-/ absolute / metric / decimal}",
@@ -369,25 +346,13 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
         f"T1C{via_hole_diameter:.3f}",
         "%",
         "G90",
-        "G05",
-        "T1"
+        "G05"
     ]
 
-    # Adding drill locations from socket_locations
-    for drill_hole in data["vias"]:
-        content.append(f"X{drill_hole['x']:.2f}Y{-drill_hole['y']:.2f}")  # Invert Y axis
-    
-    content.append("M30") # End of program
-
-    # Save drill file
-    file_path = os.path.join(panel_folder, "PTH.drl")
-    with open(file_path, 'w') as file:
-        file.write('\n'.join(content))
-
     # Make bite holes (non-plated)
     bite_hole_diameter = data["fabSpec"]["biteHoleDiameter"]
     fab_rail_hole_diameter = data["fabSpec"]["fabRailHoleDiameter"]
-    content = [
+    npth_header = [
         "M48",
         f"; DRILL file SmartPanelizer date {timestamp}",
         "; FORMAT={-:-/ absolute / metric / decimal}",
@@ -401,142 +366,66 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
         f"T2C{fab_rail_hole_diameter:.3f}",
         "%",
         "G90",
-        "G05",
-        "T1"
+        "G05"
     ]
 
-    # Adding drill locations from bite holes
-    for drill_hole in data["biteHoles"]:
-        content.append(f"X{drill_hole['x']:.2f}Y{-drill_hole['y']:.2f}")  # Invert Y axis
-
-    content.append("T2")
-    for drill_hole in data["fabRailHoles"]:
-        content.append(f"X{drill_hole['x']:.2f}Y{-drill_hole['y']:.2f}")  # Invert Y axis
-
-    content.append("M30") # End of program
-
-    # Save drill file
-    file_path = os.path.join(panel_folder, "NPTH.drl")
-    with open(file_path, 'w') as file:
-        file.write('\n'.join(content))
-
-    # Merge layers from panel_pads folder into panel folder
-    for layer_filename in ["copper_top.gbr", "copper_bottom.gbr", "soldermask_top.gbr", "soldermask_bottom.gbr"]:
-        source_path = panel_pads_folder / layer_filename
-        target_path = panel_folder / layer_filename
-        if source_path.exists():
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-
-                print(f"🔵 Merging pad layer: {layer_filename}...")
-
-                # Merge the panel pads into the panel layer
-                source = GerberFile.open(source_path)
-                target = GerberFile.open(target_path)
-                target.merge(source)
-                target.save(target_path)
-        else:
-            print(f"🟠 No pad layer found for {layer_filename}, skipping pad merging for this layer")
-
-    # Offset panel layers by gerber origin
-    if use_sr_command and (gerber_origin["x"] != 0 or gerber_origin["y"] != 0):
-        # If we're using the SR command instead of gerbonara for step and repeat, the board gerbers
-        # will not have had their gerber origin compensated for, since gerbonara .offset() not used.
-        # Instead of offsetting the boards, we'll offset the panel infrastructure, since it's less
-        # likely to get corrupted by gerbonara than the user boards. This does mean the final gerbers
-        # will have a weird origin, but at least they won't be corrupt.
-        for file in os.listdir(panel_folder):
-            if file.endswith(".gbr") or file.endswith(".drl"):
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    source_path = panel_folder / file
-                    source = GerberFile.open(source_path) if file.endswith(".gbr") else ExcellonFile.open(source_path)
-                    source.offset(-gerber_origin["x"], gerber_origin["y"]) # NOTE: Works with floats despite saying int, don't round it
-                    source.save(source_path)
-                    print(f"🔵 Applied gerber origin offset to panel layer: {file}...")
-    
-    # Merge the generated panel layers into the (step and repeated) user gerber layers
-    for file in os.listdir(panel_folder):
-        # Make sure same filename exists in output folder before merging
-        if ((output_folder / file).exists()):
-            if (file.endswith(".gbr") or file.endswith(".drl")):
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-
-                    print(f"🔵 Merging panel layer with output file: {file}...")
-
-                    # Merge the panel layer in gerbers_folder
-                    source_path = panel_folder / file
-                    target_path = output_folder / file
-                    source = GerberFile.open(source_path) if file.endswith(".gbr") else ExcellonFile.open(source_path)
-                    target = GerberFile.open(target_path) if file.endswith(".gbr") else ExcellonFile.open(target_path)
-                    target.merge(source)
-                    target.save(target_path)
-        else:
-            # If the file doesn't exist in the output folder, just copy it there (eg. vcut and outline)
-            print(f"🔵 Copying panel layer to output folder: {file}...")
-            source_path = panel_folder / file
-            target_path = output_folder / file
-            if source_path.exists():
-                os.rename(source_path, target_path)
+    # Save drill files (vias from socket_locations, bite holes and fab rail holes), both at once since they're independent
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pth = executor.submit(write_drill_file, panel_folder / "PTH.drl", pth_header, [("T1", data["vias"])])
+        npth = executor.submit(write_drill_file, panel_folder / "NPTH.drl", npth_header, 
+                               [("T1", data["biteHoles"]), ("T2", data["fabRailHoles"])])
+        panel_layers["PTH.drl"] = pth.result()
+        panel_layers["NPTH.drl"] = npth.result()
 
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
 
-        # Put vcut on board outline layer (JLC requirement)
-        source_path = output_folder / "vcut_all.gbr"
-        target_path = output_folder / "outline_all.gbr"
-        source = GerberFile.open(source_path)
-        target = GerberFile.open(target_path)
-        target.merge(source)
-        target.save(target_path)
-        os.remove(source_path)  # Remove seperate vcut file after merging
-
-        # Merge PTH drill files
-        source_path = panel_folder / "PTH.drl"
-        target_path = output_folder / "PTH.drl"
-        source = ExcellonFile.open(source_path)
-        target = ExcellonFile.open(target_path)
-        target.merge(source)
-        target.save(target_path)
-
-        source_path = panel_folder / "NPTH.drl"
-        target_path = output_folder / "NPTH.drl"
-        source = ExcellonFile.open(source_path)
-        target = ExcellonFile.open(target_path)
-        target.merge(source)
-        target.save(target_path)
+        # Offset panel layers by gerber origin
+        if use_sr_command and (gerber_origin["x"] != 0 or gerber_origin["y"] != 0):
+            # If we're using the SR command instead of gerbonara for step and repeat, the board gerbers
+            # will not have had their gerber origin compensated for, since gerbonara .offset() not used.
+            # Instead of offsetting the boards, we'll offset the panel infrastructure, since it's less
+            # likely to get corrupted by gerbonara than the user boards. This does mean the final gerbers
+            # will have a weird origin, but at least they won't be corrupt.
+            for layer_filename, panel_layer in panel_layers.items():
+                panel_layer.offset(-gerber_origin["x"], gerber_origin["y"]) # NOTE: Works with floats despite saying int, don't round it
+                print(f"🔵 Applied gerber origin offset to panel layer: {layer_filename}...")
+
+        # Merge the generated panel layers into the (step and repeated) user gerber layers
+        for layer_filename, panel_layer in panel_layers.items():
+            target_path = output_folder / layer_filename
+            if layer_filename in output_layers:
+                target = output_layers[layer_filename]
+            elif target_path.exists():
+                # Layers stepped and repeated with the SR command are only on disk
+                target = GerberFile.open(target_path) if layer_filename.endswith(".gbr") else ExcellonFile.open(target_path)
+            else:
+                # If the layer doesn't exist in the output folder, just save it there (eg. outline)
+                print(f"🔵 Copying panel layer to output folder: {layer_filename}...")
+                output_layers[layer_filename] = panel_layer
+                continue
+
+            print(f"🔵 Merging panel layer with output file: {layer_filename}...")
+            target.merge(panel_layer)
+            output_layers[layer_filename] = target
+
+        # Save every merged layer once
+        for layer_filename, output_layer in output_layers.items():
+            output_layer.save(output_folder / layer_filename)
 
     # Convert all .gbr to protel extensions (not required, but might help with layer identification)
-    for file in os.listdir(output_folder):
-        if file.endswith(".gbr"):
-            base = os.path.splitext(file)[0]
-            ext = ""
-            if "copper_top" in base:
-                ext = ".GTL"
-            elif "copper_bottom" in base:
-                ext = ".GBL"
-            elif "soldermask_top" in base:
-                ext = ".GTS"
-            elif "soldermask_bottom" in base:
-                ext = ".GBS"
-            elif "silkscreen_top" in base:
-                ext = ".GTO"
-            elif "silkscreen_bottom" in base:
-                ext = ".GBO"
-            elif "outline_all" in base:
-                ext = ".GM1"
-            elif "solderpaste_top" in base:
-                ext = ".GTP"
-            elif "solderpaste_bottom" in base:
-                ext = ".GBP"
-            else:
-                continue  # Skip files that don't match known types
+    with os.scandir(output_folder) as entries:
+        for entry in entries:
+            base, ext = os.path.splitext(entry.name)
+            if ext != ".gbr":
+                continue
 
-            os.rename(
-                output_folder / file,
-                output_folder / (base + ext)
-            )
+            # Skip files that don't match known types
+            protel_ext = next((protel_ext for layer, protel_ext in protel_extensions if layer in base), None)
+            if protel_ext is None:
+                continue
+
+            os.rename(entry.path, os.path.join(output_folder, base + protel_ext))
 
     if use_sr_command:
         # Replace all step and repeat placeholders with actual SR commands
@@ -551,10 +440,10 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
                 y_spacing=-step["y"]
             )
     
-    compress_directory(thread_context.job_folder / "output")
+    compress_directory(output_folder)
 
     # Write to a text fail indicating zip ready
-    with open(thread_context.job_folder / "zip_ready.txt", 'w') as file:
+    with open(job_folder / "zip_ready.txt", 'w') as file:
         file.write("ready")
 
 
@@ -564,6 +453,167 @@ def panelize(job_id: str, job_folder: Path, data: PanelizeStartRequest) -> dict:
         "failed": False
     }
 
+class LayerAccumulator:
+    """
+    Holds a parsed Gerber or Excellon layer in memory while offset copies of its objects are added,
+    so stepping and repeating only saves the layer once, instead of an open, merge and save per copy.
+    """
+    def __init__(self, layer: GerberFile | ExcellonFile):
+        self.layer = layer
+
+    def add_offset_copies(self, objects: list, offsets: np.ndarray) -> None:
+        """
+        Add a copy of the given objects to the layer for every offset
+
+        Parameters:
+            objects: Gerber or Excellon objects to copy
+            offsets: (N, 2) array of (dx, dy) offsets in mm
+        """
+        for dx, dy in offsets.tolist():
+            for obj in objects:
+                clone = copy.copy(obj)
+                clone.offset(dx, dy) # NOTE: .offset() replaces coordinates rather than mutating them, so a shallow copy is enough
+                self.layer.objects.append(clone)
+
+        if len(offsets) > 1:
+            # Like .merge(), the combined layer is no longer saved with the source file's import settings
+            self.layer.import_settings = None
+
+def write_drill_file(file_path: Path, header: list, tools: list) -> ExcellonFile:
+    """
+    Writes a drill file in a single write, and opens it with gerbonara
+
+    Parameters:
+        file_path: Path of the drill file to write
+        header: Lines of the drill file header, up to the first tool selection
+        tools: List of (tool, holes) tuples, where holes is a list of {"x", "y"} dicts in mm
+
+    Returns:
+        ExcellonFile: The written drill file
+    """
+    buffer = bytearray('\n'.join(header).encode())
+    for tool, holes in tools:
+        buffer += f"\n{tool}".encode()
+        for hole in holes:
+            buffer += f"\nX{hole['x']:.2f}Y{-hole['y']:.2f}".encode()  # Invert Y axis
+
+    buffer += b"\nM30" # End of program
+    file_path.write_bytes(buffer)
+
+    return ExcellonFile.open(file_path)
+
+def arc_center(start: tuple, end: tuple, r: float, sweep_flag: int) -> tuple:
+    """
+    Returns the center of an SVG arc from start to end with radius r (assuming rx == ry and no rotation)
+    """
+    x1, y1 = start
+    x2, y2 = end
+
+    dx = x2 - x1
+    dy = y2 - y1
+    d = math.hypot(dx, dy)
+
+    # midpoint
+    mx = (x1 + x2) / 2
+    my = (y1 + y2) / 2
+
+    # distance from midpoint to center
+    h = math.sqrt(max(r*r - (d/2)*(d/2), 0))
+
+    # perpendicular offset from midpoint to the first candidate center
+    ox = -dy / d * h
+    oy = dx / d * h
+
+    # two possible centers
+    cx1, cy1 = mx + ox, my + oy
+    cx2, cy2 = mx - ox, my - oy
+
+    # choose based on sweep flag, using the winding of the first candidate
+    first_is_clockwise = (x1 - cx1)*(y2 - cy1) - (y1 - cy1)*(x2 - cx1) < 0
+    if sweep_flag == 1:  # clockwise
+        return (cx1, cy1) if first_is_clockwise else (cx2, cy2)
+    else:                # counter-clockwise
+        return (cx2, cy2) if first_is_clockwise else (cx1, cy1)
+
+@lru_cache(maxsize=None)
+def svg_flatten_version(search_path: str = None) -> str:
+    """
+    The installed svg-flatten version, part of the cache key so an upgrade never reuses older output.
+
+    Parameters:
+        search_path: The PATH svg-flatten is run with
+    """
+    try:
+        return metadata.version("svg-flatten-wasi")
+    except metadata.PackageNotFoundError:
+        # Not installed through pip, so fall back to the identity of the executable itself
+        executable = shutil.which("wasi-svg-flatten", path=search_path)
+        if executable is None:
+            return "unknown"
+        stat = os.stat(executable)
+        return f"{executable}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def svg_flatten(svg_filename: str, gerber_filename: str, env: dict, output_format: str = None) -> None:
+    """
+    Runs wasi-svg-flatten on an SVG file in the job folder, reusing a cached Gerber
+    if the same SVG content has been flattened with the same format and version before.
+    """
+    svg_path = thread_context.job_folder / svg_filename
+    gerber_path = thread_context.job_folder / gerber_filename
+
+    key = svg_path.read_bytes() + f"\0{output_format or ''}\0{svg_flatten_version(env.get('PATH'))}".encode()
+    digest = hashlib.sha256(key).hexdigest()
+    cache_path = svg_flatten_cache_dir / f"{digest}.gbr"
+
+    # NOTE: Copy rather than hardlink, since the panel gerbers get rewritten in place later on
+    try:
+        shutil.copyfile(cache_path, gerber_path)
+        os.utime(cache_path)  # Mark as recently used, for pruning
+        print(f"🔵 Using cached svg-flatten output for {svg_filename}")
+        return
+    except FileNotFoundError:
+        pass  # Not cached, or pruned by another job in the meantime
+
+    # Remove any output left over in the job folder, so only this run's output can end up in the cache
+    gerber_path.unlink(missing_ok=True)
+
+    command = ["wasi-svg-flatten"] + (["--format", output_format] if output_format else []) + [svg_filename, gerber_filename]
+    result = subprocess.run(command, cwd=thread_context.job_folder, env=env)
+
+    if result.returncode != 0:
+        print(f"🔴 svg-flatten failed on {svg_filename} with exit code {result.returncode}, not caching its output")
+        return
+
+    if gerber_path.exists() and gerber_path.stat().st_size > 0:
+        # Write to a temporary file first, so concurrent jobs never see a partial cache entry
+        svg_flatten_cache_dir.mkdir(parents=True, exist_ok=True)
+        temporary_path = svg_flatten_cache_dir / f"{digest}.{thread_context.job_id}.tmp"
+        shutil.copyfile(gerber_path, temporary_path)
+        os.replace(temporary_path, cache_path)
+        prune_svg_flatten_cache()
+
+def prune_svg_flatten_cache() -> None:
+    """
+    Removes svg-flatten cache entries that haven't been used for svg_flatten_cache_max_age, then the least recently 
+    used ones until the cache fits in svg_flatten_cache_max_bytes.
+    """
+    entries = []
+    for path in svg_flatten_cache_dir.glob("*.gbr"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Removed by another job
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    # Most recently used first
+    entries.sort(reverse=True, key=lambda entry: entry[0])
+    oldest_allowed = time.time() - svg_flatten_cache_max_age
+    total_size = 0
+    for modified, size, path in entries:
+        total_size += size
+        if modified < oldest_allowed or total_size > svg_flatten_cache_max_bytes:
+            path.unlink(missing_ok=True)
+
 def consolidate_component_files(count, step, gerber_origin) -> dict:
     """
     Adaptation of same-named function from consolidate.py to work for panelization
@@ -574,68 +624,77 @@ def consolidate_component_files(count, step, gerber_origin) -> dict:
     bom_file_path = assembly_dir / "BOM.csv"
     cpl_file_path = assembly_dir / "CPL.csv"
 
+    # Every board in the panel is identical, so the BOM and CPL files are only parsed once, for a template board
+    board = Module("panel_board", "1.0", (0, 0), 0)
+    module_name_version = f"{board.name}_{board.version}"
+    board_components = {}
+    collect_references(bom_file_path, cpl_file_path, board, {}, board_components, set(), 0)
+
+    # Placed CPL rows of the board, with their positions as an array to offset every board at once
+    board_refs = {component["original_reference"] for component in board_components.values()}
+    with open(cpl_file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+        reader = csv.DictReader(csvfile)
+        cpl_fieldnames = reader.fieldnames
+        cpl_rows = [row for row in reader if row.get("Ref", "").strip() in board_refs]
+    cpl_positions = np.array([[float(row.get("PosX", 0)), float(row.get("PosY", 0))] for row in cpl_rows]).reshape(-1, 2)
+
+    # Position of each board in the panel, in the same order as they're numbered (row by row)
+    board_positions = np.stack(np.meshgrid(
+        np.arange(int(count["x"])) * step["x"] + gerber_origin["x"],
+        -(np.arange(int(count["y"])) * step["y"] + gerber_origin["y"])  # Invert Y axis, like Module does
+    ), -1).reshape(-1, 2)
+    placed_positions = (cpl_positions[None, :, :] + board_positions[:, None, :]).tolist()
+
     # Dictionary to store all components with their unique reference designators
-    # ~~Key format: "module_index:module_name:original_ref" -> ensures uniqueness across duplicate modules~~
+    # Key format: "module_index:module_name:original_ref" -> ensures uniqueness across boards
     all_components = {}
     
-    # Dictionary to track reference designator remapping
-    # Key: "module_index:module_name:original_ref", Value: "new_unique_ref"
-    ref_mapping = {}
-    
     # Dictionary to track the CPL data for each component
     cpl_entries = {}
     
     # Track used reference prefixes to avoid duplicates
     used_refs = set()
-    
-    modules = []
-
-    # First pass: collect all reference designators and assign unique ones
-    for y_index in range(int(count["y"])):
-        for x_index in range(int(count["x"])):
-
-            # Pretend the user's board is a module to reuse existing code
-            module = Module("panel_board", "1.0", (
-                x_index * step["x"] + gerber_origin["x"],
-                y_index * step["y"] + gerber_origin["y"]
-            ), 0)
-            modules.append(module)
-
-            # Process BOM file and collect references - using module_idx to ensure uniqueness
-            collect_references(
-                bom_file_path, 
-                cpl_file_path, 
-                module, 
-                ref_mapping, 
-                all_components, 
-                used_refs, 
-                len(modules) - 1
-            )
+
+    # Assign unique references for each board
+    for module_idx in range(len(board_positions)):
+        new_refs = {}
+        for component in board_components.values():
+            ref = component["original_reference"]
+            new_refs[ref] = unique_reference(ref, module_idx, used_refs)
+            all_components[f"{module_idx}:{module_name_version}:{ref}"] = {
+                **component,
+                "new_reference": new_refs[ref],
+                "module_idx": module_idx
+            }
+
+        # Offset the board's CPL rows (boards aren't rotated in the panel)
+        for row, (new_x, new_y) in zip(cpl_rows, placed_positions[module_idx]):
+            new_ref = new_refs[row["Ref"].strip()]
+            updated_row = row.copy()
+            updated_row["Ref"] = new_ref
+            updated_row["PosX"] = f"{new_x:.6f}"
+            updated_row["PosY"] = f"{new_y:.6f}"
+            updated_row["Rot"] = f"{float(row.get('Rot', 0)) % 360:.6f}"
+            cpl_entries[new_ref] = {
+                "row": updated_row,
+                "fieldnames": cpl_fieldnames
+            }
     print(f"🔵 Created {len(all_components)} component instances from BOM")
     
     # Process component grouping (same value and package get same part number)
     component_groups = group_components(all_components)
     print(f"🔵 Created {len(component_groups)} groups of same component")
     
-    # Second pass: Process CPL files with updated reference designators
-    for module_idx, module in enumerate(modules):
-        # Process CPL file with updated references - using module_idx to match with first pass
-        process_cpl_file(cpl_file_path, module, ref_mapping, cpl_entries, module_idx)
-    
     # Write consolidated BOM to output file
-    write_consolidated_bom(component_groups, output_dir, "panel")
-    bom_name = "BOM_panel.csv"
-    if (output_dir / bom_name).exists():
-        os.rename(output_dir / bom_name, output_dir / "full_panel_BOM.csv")
-    else:
+    bom_name = "full_panel_BOM.csv"
+    write_consolidated_bom(component_groups, output_dir, "panel", out_filename=bom_name)
+    if not (output_dir / bom_name).exists():
         error("Failed to write consolidated BOM file")
 
     # Write consolidated CPL to output file
-    write_consolidated_cpl(cpl_entries, output_dir, "panel")
-    cpl_name = "CPL_panel-top-pos.csv"
-    if (output_dir / cpl_name).exists():
-        os.rename(output_dir / cpl_name, output_dir / "full_panel_CPL.csv")
-    else:
+    cpl_name = "full_panel_CPL.csv"
+    write_consolidated_cpl(cpl_entries, output_dir, "panel", out_filename=cpl_name)
+    if not (output_dir / cpl_name).exists():
         error("Failed to write consolidated CPL file")
 
     return {
@@ -1,14 +1,39 @@
-import shutil
+import io
+import os
+import re
+import math
+import copy
+import mmap
+import pickle
+import copyreg
+import zipfile
+import multiprocessing
 
 from pathlib import Path
 from gerbonara import GerberFile, ExcellonFile
-from numpy import pi
-from typing import Union, List, Optional
+from gerbonara.graphic_objects import Flash, Line, Arc, Region
+from gerbonara.utils import MM, Inch, LengthUnit
+import numpy as np
+from typing import Union, List, Optional, Tuple, Dict
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from module import Module
 
 import thread_context
 
+# File types merged by merge_stacks, besides the board outline (only merged for connectors)
+GERBER_SUFFIXES = frozenset({'.GBR', '.DRL', '.XLN', '.GTL', '.GBL', '.GTS', '.GBS', '.GTO', '.GBO', '.G2', '.G3', '.GTP', '.GBP'})
+DRILL_SUFFIXES = frozenset({'.DRL', '.XLN'})
+OUTLINE_SUFFIX = '.GM1'
+CONNECTOR_PATTERN = re.compile('connector', re.IGNORECASE)
+
+# Each spawned worker takes around a quarter of a second to start and its files have to be pickled back, so
+# directories are only loaded in worker processes when the ones other than the largest add up to more than this
+# (gerbonara parses roughly 2 MB/s, so around 4 s of parsing)
+PARALLEL_LOAD_MIN_BYTES = 8 * 1024 * 1024
+
 def merge_layers(modules:List[Module], layer_name, board_name, modules_dir='./backend_module_data', output_dir='./output') -> GerberFile | None:
     """
     Merges specified layers from multiple module configurations into a single Gerber file.
@@ -25,41 +50,21 @@ def merge_layers(modules:List[Module], layer_name, board_name, modules_dir='./ba
         GerberFile: A combined GerberFile object from Gerbonara if any files were processed, otherwise None.
     """
     # Define the directories for input and output
-    modules_dir_path = Path(modules_dir)
     output_dir_path = thread_context.job_folder / Path(output_dir)
 
     # Ensure the directory exists
     output_dir_path.mkdir(parents=True, exist_ok=True)
 
-    # Initialise an empty GerberFile for merging
-    merged_file = None
+    # Load and transform each module's layer in parallel, since they're independent of each other
+    # Modules used more than once share a directory, so their layer is only parsed once
+    module_dirs = resolve_module_dirs(modules, modules_dir)
+    groups = group_indices([module_dir_path for _, module_dir_path, _ in module_dirs])
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        loaded_groups = list(executor.map(lambda indices: load_layer(module_dirs[indices[0]][2], layer_name, [module_dirs[index][0] for index in indices]), groups.values()))
+    current_files = ungroup(groups.values(), loaded_groups)
 
-    # Process each module
-    for module in modules:
-        # Path to the module's directory within the /gerbers directory
-        module_path = modules_dir_path / f"{module.name}_{module.version}" / 'gerbers'
-
-        # Check if the directory exists
-        if not module_path.exists() or not module_path.is_dir():
-            print(f"🔴 Module not found: {module_path}")
-            continue
-
-        # Find the first file that includes the specified layer_name in its filename
-        file_path = next(module_path.glob(f'*{layer_name}'), None)
-        if file_path and file_path.is_file():
-            # Load the Gerber file
-            current_file = GerberFile.open(file_path)
-            
-            # Apply transformations 
-            rotation_radians = module.rotation * (pi / 180)
-            current_file.rotate(angle=rotation_radians)
-            current_file.offset(dx=module.position.x, dy=module.position.y)
-
-            # If there's no merged Gerber yet, use the current one
-            if merged_file is None:
-                merged_file = current_file
-            else: 
-                merged_file.merge(current_file)
+    # Merge in module order, so the output doesn't depend on which thread finished first
+    merged_file = reduce_merge([current_file for current_file in current_files if current_file is not None])
 
     # Save the merged Gerber file to the output directory, if any files were processed
     if merged_file:
@@ -70,6 +75,142 @@ def merge_layers(modules:List[Module], layer_name, board_name, modules_dir='./ba
         print(f"🔴 No files matching '{layer_name}' were processed.")
         return None
 
+def load_layer(module_files: Dict[str, str], layer_name: str, modules: List[Module]) -> List[Optional[GerberFile]]:
+    """
+    Loads a layer shared by one or more modules, and moves a copy of it to each module's position and rotation.
+    Parameters:
+        module_files (Dict[str, str]): The path of each file in the modules' directory of Gerber files, keyed by filename.
+        layer_name (str): The name of the layer to load.
+        modules (List[Module]): The modules the layer belongs to, all from the same directory.
+    Returns:
+        List[Optional[GerberFile]]: The transformed layer for each module, or None if the modules don't have the layer.
+    """
+    # Find the first file that includes the specified layer_name in its filename
+    file_path = next((path for name, path in module_files.items() if name.endswith(layer_name)), None)
+    if not file_path:
+        return [None] * len(modules)
+
+    # Load the Gerber file once, and apply each module's transformations to its own copy
+    return transformed_copies(open_gerber(file_path), modules)
+
+def transformed_copies(file: GerberFile | ExcellonFile, modules: List[Optional[Module]]) -> List[GerberFile | ExcellonFile]:
+    """
+    Transforms a parsed file to the placement of each module, copying it for all but the last module.
+    Parameters:
+        file (GerberFile | ExcellonFile): The parsed file, which is transformed in place for the last module.
+        modules (List[Optional[Module]]): The modules to transform the file for, or None to leave a copy untransformed.
+    Returns:
+        List[GerberFile | ExcellonFile]: The transformed file for each module, in the same order.
+    """
+    transformed = []
+    for index, module in enumerate(modules):
+        current_file = file if index == len(modules) - 1 else copy_file(file)
+        if module:
+            transform_file(current_file, module)
+        transformed.append(current_file)
+
+    return transformed
+
+def copy_file(file: GerberFile | ExcellonFile) -> GerberFile | ExcellonFile:
+    """
+    Copies a parsed file so it can be transformed and merged separately from the original. Only the objects (and 
+    the lists merging appends to) are copied, since transforming an object replaces its coordinates and aperture 
+    rather than changing them in place, which is still much faster than parsing the file again.
+    Parameters:
+        file (GerberFile | ExcellonFile): The file to copy.
+    Returns:
+        GerberFile | ExcellonFile: The copy.
+    """
+    duplicate = copy.copy(file)
+    duplicate.objects = [copy.copy(obj) for obj in file.objects]
+    duplicate.comments = list(file.comments)
+    return duplicate
+
+def group_indices(keys: List) -> Dict[object, List[int]]:
+    """
+    Groups the indices of equal keys, e.g. modules that share a directory, in order of first appearance.
+    Parameters:
+        keys (List): The keys to group.
+    Returns:
+        Dict[object, List[int]]: The indices of each distinct key.
+    """
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    return groups
+
+def ungroup(groups, grouped_results: List[List]) -> List:
+    """
+    Puts the results of each group (see group_indices) back in the order of the original keys.
+    Parameters:
+        groups: The indices of each group.
+        grouped_results (List[List]): The results of each group, one per index in the group.
+    Returns:
+        List: The results in the original order.
+    """
+    results = [None] * sum(len(indices) for indices in groups)
+    for indices, group_results in zip(groups, grouped_results):
+        for index, result in zip(indices, group_results):
+            results[index] = result
+    return results
+
+def resolve_module_dirs(modules: List[Module], modules_dir='./backend_module_data') -> List[Tuple[Module, Path, Dict[str, str]]]:
+    """
+    Finds the directory of Gerber files for each module, skipping modules that don't have one.
+    Parameters:
+        modules (List[Module]): A list of Module objects.
+        modules_dir (str, optional): The directory containing module subdirectories. Defaults to './backend_module_data'.
+    Returns:
+        List[Tuple[Module, Path, Dict[str, str]]]: Each found module, with its directory of Gerber files, and the path
+                                                   of each file in it keyed by filename.
+    """
+    manifest = build_module_manifest(modules, modules_dir)
+    modules_dir_path = Path(modules_dir)
+
+    module_dirs = []
+    for module in modules:
+        module_dir_path = modules_dir_path / f"{module.name}_{module.version}" / 'gerbers'
+
+        module_files = manifest[str(module_dir_path)]
+        if module_files is None:
+            print(f"🔴 Module not found: '{module_dir_path}'")
+            continue
+
+        module_dirs.append((module, module_dir_path, module_files))
+    return module_dirs
+
+def build_module_manifest(modules: List[Module], modules_dir='./backend_module_data') -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Scans each module's directory of Gerber files once per job, so merge_layers and merge_stacks don't check and
+    scan the same directories again. The manifest is kept in the thread's thread_context, and rebuilt when the job changes.
+    Parameters:
+        modules (List[Module]): A list of Module objects.
+        modules_dir (str, optional): The directory containing module subdirectories. Defaults to './backend_module_data'.
+    Returns:
+        Dict[str, Optional[Dict[str, str]]]: For each module directory, the path of each file in it keyed by filename, 
+                                             or None if the directory doesn't exist.
+    """
+    # Kept per thread, since jobs run in their own threads and would otherwise replace each other's manifest
+    local = thread_context.thread_context
+    if getattr(local, 'module_manifest_job_id', None) != thread_context.job_id or not hasattr(local, 'module_manifest'):
+        local.module_manifest = {}
+        local.module_manifest_job_id = thread_context.job_id
+    manifest = local.module_manifest
+
+    modules_dir_path = Path(modules_dir)
+    for module in modules:
+        module_dir_path = str(modules_dir_path / f"{module.name}_{module.version}" / 'gerbers')
+        if module_dir_path in manifest:
+            continue
+
+        try:
+            with os.scandir(module_dir_path) as entries:
+                manifest[module_dir_path] = {entry.name: entry.path for entry in entries if entry.is_file()}
+        except (FileNotFoundError, NotADirectoryError):
+            manifest[module_dir_path] = None
+
+    return manifest
+
 def merge_stacks(modules: List[Module], board_name: str, modules_dir='./backend_module_data', output_dir='./output', generated_dir='./generated') -> None:
     """
     Merges Gerber stacks (sets of files) from multiple modules into a single output directory and applies necessary transformations.
@@ -86,35 +227,123 @@ def merge_stacks(modules: List[Module], board_name: str, modules_dir='./backend_
     """
         
     # Path objects
-    modules_dir_path = Path(modules_dir)
     output_dir_path = thread_context.job_folder / Path(output_dir)
     generated_dir_path = thread_context.job_folder / Path(generated_dir)
     
-    # Initialise a dictionary to store the filepaths for the BOM and CPL files for each module
-    fabrication_data_filepaths = {
-        "BOM": [],
-        "CPL": []
-    }
-
     # Ensure the directory exists
     output_dir_path.mkdir(parents=True, exist_ok=True)
 
-    for module in modules:
-        module_dir_path = modules_dir_path / f"{module.name}_{module.version}" / 'gerbers'
-
-        if not module_dir_path.exists() or not module_dir_path.is_dir():
-            print(f"🔴 Module not found: '{module_dir_path}'")
-            continue
-        
-        # Merge each module's Gerber or fabrication files into the output directory, and apply transformations 
-        # by passing the information from each modules 
-        # Along the way collect the filepaths for the CPL and BOM files for each module...
-        merge_directories(output_dir_path, module_dir_path, board_name, module)
+    # Each module's Gerber or fabrication files are merged into the output directory, with the transformations
+    # from each module applied
+    source_dir_paths = []
+    source_modules = []
+    source_dir_files = []
+    for module, module_dir_path, module_files in resolve_module_dirs(modules, modules_dir):
+        source_dir_paths.append(module_dir_path)
+        source_modules.append(module)
+        source_dir_files.append(module_files)
             
     # And lastly, merge with the additional generated files from /generated directory
-    merge_directories(output_dir_path, generated_dir_path, board_name, None)
+    source_dir_paths.append(generated_dir_path)
+    source_modules.append(None)
+    source_dir_files.append(None)
+
+    # Load and transform each directory in parallel, since they're independent of each other
+    loaded_directories = load_directories(source_dir_paths, board_name, source_modules, source_dir_files)
+
+    # Merge all directories at once, so each output file is only saved once
+    save_merged_files(output_dir_path, [source_file for source_files in loaded_directories for source_file in source_files])
+
+def directory_size(source_dir_path: Path, source_files_index: Optional[Dict[str, str]] = None) -> int:
+    """
+    Adds up the sizes of the files in a directory.
+    Parameters:
+        source_dir_path (Path): The directory.
+        source_files_index (Dict[str, str], optional): The path of each file in the directory keyed by filename, 
+                                                       if it was already scanned (see build_module_manifest).
+    Returns:
+        int: The total size in bytes.
+    """
+    if source_files_index is not None:
+        return sum(os.path.getsize(path) for path in source_files_index.values())
+
+    with os.scandir(source_dir_path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+def load_directories(source_dir_paths: List[Path], board_name: str, modules: List[Optional[Module]], 
+                     source_files_indexes: List[Optional[Dict[str, str]]]) -> List[List[Tuple[str, GerberFile | ExcellonFile]]]:
+    """
+    Loads and transforms several directories (see load_directory). Large loads run in worker processes, since 
+    gerbonara's parsing is pure Python and threads would mostly wait on each other for the GIL, but smaller ones 
+    use threads, since starting the workers would take longer than the parsing. Also falls back to threads if the 
+    worker processes can't be started or their results can't be sent back.
+    
+    Parameters:
+        source_dir_paths (List[Path]): The directories to load.
+        board_name (str): The name of the board to be used in the new filenames.
+        modules (List[Optional[Module]]): The module whose transformations are applied to each directory, or None.
+        source_files_indexes (List[Optional[Dict[str, str]]]): The already scanned files of each directory, or None.
+        
+    Returns:
+        List[List[Tuple[str, GerberFile | ExcellonFile]]]: The loaded files of each directory, in the same order.
+    """
+    # Modules used more than once share a directory, so each directory is only parsed once
+    groups = group_indices(source_dir_paths)
+    group_paths = [source_dir_paths[indices[0]] for indices in groups.values()]
+    group_modules = [[modules[index] for index in indices] for indices in groups.values()]
+    group_indexes = [source_files_indexes[indices[0]] for indices in groups.values()]
+    max_workers = min(len(groups), os.cpu_count() or 1)
+    
+    # Starting the worker processes is only worth it when there's enough to parse besides the largest directory
+    loaded_groups = None
+    group_sizes = sorted(directory_size(path, index) for path, index in zip(group_paths, group_indexes))
+    if max_workers > 1 and sum(group_sizes[:-1]) >= PARALLEL_LOAD_MIN_BYTES:
+        try:
+            # NOTE: spawn rather than fork, since the server runs jobs in threads and forking those isn't safe
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                serialized_groups = executor.map(load_directory_copies_serialized, group_paths, repeat(board_name), group_modules, group_indexes)
+                loaded_groups = [pickle.loads(data) for data in serialized_groups]
+        except (OSError, BrokenProcessPool, pickle.PicklingError) as error:
+            print(f"🟠 Couldn't load directories in worker processes, using threads instead: {error}")
+    
+    if loaded_groups is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            loaded_groups = list(executor.map(load_directory_copies, group_paths, repeat(board_name), group_modules, group_indexes))
+
+    return ungroup(groups.values(), loaded_groups)
+
+def restore_length_unit(shorthand: str) -> LengthUnit:
+    """
+    Returns gerbonara's global instance of a length unit, so files sent between processes keep their units.
+    
+    Parameters:
+        shorthand (str): The unit's shorthand, 'mm' or 'in'.
+        
+    Returns:
+        LengthUnit: gerbonara's MM or Inch.
+    """
+    return MM if shorthand == MM.shorthand else Inch
 
-def merge_directories(target_dir_path: Path, source_dir_path: Path, board_name: str, module=Optional[Module]) -> None:
+def load_directory_copies_serialized(source_dir_path: Path, board_name: str, modules: List[Optional[Module]], 
+                                     source_files_index: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    Runs load_directory_copies in a worker process, and pickles the loaded files so that unpickling them gives back 
+    gerbonara's global MM and Inch instances rather than copies.
+    NOTE: gerbonara compares units by identity (e.g. settings.unit == MM), otherwise an Excellon file loaded in a 
+    worker process is written back in inches. The reducer is only set on this pickler, not for the whole process.
+    Parameters:
+        See load_directory_copies.
+    Returns:
+        bytes: The pickled result of load_directory_copies.
+    """
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[LengthUnit] = lambda unit: (restore_length_unit, (unit.shorthand,))
+    pickler.dump(load_directory_copies(source_dir_path, board_name, modules, source_files_index))
+    return buffer.getvalue()
+
+def merge_directories(target_dir_path: Path, source_dir_path: Path, board_name: str, module: Optional[Module] = None) -> None:
     """
     Merges entire directories of Gerber and Excellon files from a source directory into a 
     target directory, applying optional transformations if the module information is provided.
@@ -122,79 +351,293 @@ def merge_directories(target_dir_path: Path, source_dir_path: Path, board_name:
         target_dir_path (Path): The path to the target directory where merged files will be saved.
         source_dir_path (Path): The path to the source directory containing files to be merged.
         board_name (str): The name of the board to be used in the new filenames.
-        module 
-        fabrication_data_filepaths (dict, optional): A dictionary containing lists of filepaths for BOM and CPL files.
+        module (Module, optional): The module whose position and rotation are applied to the files.
     Returns:
         None
     """
-    
+    save_merged_files(target_dir_path, load_directory(source_dir_path, board_name, module))
+
+def load_directory(source_dir_path: Path, board_name: str, module: Optional[Module] = None, 
+                   source_files_index: Optional[Dict[str, str]] = None) -> List[Tuple[str, GerberFile | ExcellonFile]]:
+    """
+    Loads a directory of Gerber and Excellon files, applying optional transformations if the module 
+    information is provided.
+    Parameters:
+        source_dir_path (Path): The path to the source directory containing files to be merged.
+        board_name (str): The name of the board to be used in the new filenames.
+        module (Module, optional): The module whose position and rotation are applied to the files.
+        source_files_index (Dict[str, str], optional): The path of each file in the directory keyed by filename, 
+                                                       if it was already scanned (see build_module_manifest).
+    Returns:
+        List[Tuple[str, GerberFile | ExcellonFile]]: The loaded files, with their new filename.
+    """
+    return load_directory_copies(source_dir_path, board_name, [module], source_files_index)[0]
+
+def load_directory_copies(source_dir_path: Path, board_name: str, modules: List[Optional[Module]], 
+                          source_files_index: Optional[Dict[str, str]] = None) -> List[List[Tuple[str, GerberFile | ExcellonFile]]]:
+    """
+    Loads a directory of Gerber and Excellon files once for one or more modules placed from it, giving each 
+    module its own transformed copy of the files (see load_directory).
+    Parameters:
+        source_dir_path (Path): The path to the source directory containing files to be merged.
+        board_name (str): The name of the board to be used in the new filenames.
+        modules (List[Optional[Module]]): The modules whose position and rotation are applied to each copy, 
+                                          or [None] for a directory that isn't a module's (e.g. generated files).
+        source_files_index (Dict[str, str], optional): The path of each file in the directory keyed by filename, 
+                                                       if it was already scanned (see build_module_manifest).
+    Returns:
+        List[List[Tuple[str, GerberFile | ExcellonFile]]]: The loaded files for each module, with their new filename.
+    """
+    # Modules placed from the same directory are either all modules or all None, so the first decides what's loaded
+    module = modules[0]
+    source_files = []
+
+    # Module directories are already scanned in the job's manifest, but other directories (e.g. generated files) aren't
+    if source_files_index is not None:
+        files = source_files_index.items()
+    else:
+        with os.scandir(source_dir_path) as entries:
+            files = [(entry.name, entry.path) for entry in entries if entry.is_file()]
+
     # Process each Gerber or Excellon file in the module directory
-    for source_file_path in source_dir_path.iterdir():
-        
+    for name, path in files:
         # Check if the file is a .GM1 file and if "connector" is not in the filename
-        is_board_outline = source_file_path.suffix.upper() == '.GM1'
-        is_connector = 'connector' in source_file_path.name.lower()
-            
+        suffix = os.path.splitext(name)[1].upper()
+        is_board_outline = suffix == OUTLINE_SUFFIX
+        is_connector = CONNECTOR_PATTERN.search(name) is not None
 
         # Skip .GM1 files only if they're not part of a connector
         if module and is_board_outline and not is_connector:
-            print(f"🟠 Skipping mechanical layer file for non-connector: {source_file_path}")
+            print(f"🟠 Skipping mechanical layer file for non-connector: {path}")
             continue
-            
+        
         # Process all other acceptable file types
-        if (not is_board_outline and source_file_path.suffix.upper() not in 
-            ['.GBR', '.DRL', '.XLN', '.GTL', '.GBL', '.GTS', '.GBS', '.GTO', '.GBO', '.G2', '.G3', '.GTP', '.GBP']):
-            print(f"🟠 Skipping file for merging: {source_file_path}")
+        if not is_board_outline and suffix not in GERBER_SUFFIXES:
+            print(f"🟠 Skipping file for merging: {path}")
             continue
-        
+    
         # Construct the new target filename by replacing the module name with board_name
-        # Split all the way to the last '-' to handle filenames with multiple '-' characters
-        new_file_name = f"{board_name}-{source_file_path.name.split('-', -1)[-1]}"
-        target_file_path = target_dir_path / new_file_name
+        # Partition at the last '-' to handle filenames with multiple '-' characters
+        new_file_name = f"{board_name}-{name.rpartition('-')[2]}"
 
         # Determine the type of file based on the extension
-        if source_file_path.suffix.upper() == '.DRL' or source_file_path.suffix.upper() == '.XLN':
-            source_file = ExcellonFile.open(source_file_path)
-            target_file = ExcellonFile.open(target_file_path) if target_file_path.exists() else None
-            
-            # The the modules information is provided, apply the rotation and offset
-            if module: 
-                rotation_radians = module.rotation * (pi / 180)
-                offset_x = module.position.x
-                offset_y = module.position.y
-                source_file.rotate(angle=rotation_radians)
-                source_file.offset(x=offset_x, y=offset_y)
-            
+        if suffix in DRILL_SUFFIXES:
+            source_file = ExcellonFile.open(path)
         else:
-            source_file = GerberFile.open(source_file_path)
-            target_file = GerberFile.open(target_file_path) if target_file_path.exists() else None
-            
-            # The the modules information is provided, apply the rotation and offset
-            if module:
-                rotation_radians = module.rotation * (pi / 180)
-                offset_x = module.position.x
-                offset_y = module.position.y
-                source_file.rotate(angle=rotation_radians)
-                source_file.offset(dx=offset_x, dy=offset_y)
-
-        # Merge with the target file or use the source file if no target exists
-        if target_file:
-            target_file.merge(source_file)
-            target_file.save(target_file_path)
-            
+            source_file = open_gerber(path)
+
+        source_files.append((new_file_name, source_file))
+
+    # If the modules information is provided, apply the rotation and offset to each module's copy
+    copies = [[] for _ in modules]
+    for new_file_name, source_file in source_files:
+        for module_files, transformed_file in zip(copies, transformed_copies(source_file, modules)):
+            module_files.append((new_file_name, transformed_file))
+
+    return copies
+
+def open_gerber(path: Union[str, Path]) -> GerberFile:
+    """
+    Opens a Gerber file like GerberFile.open(), but reads it through a read-only memory map rather than a file buffer.
+    NOTE: Excellon files still use ExcellonFile.open(), since it also looks for drill settings files next to them
+    Parameters:
+        path (str or Path): The path to the Gerber file.
+    Returns:
+        GerberFile: The parsed Gerber file.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            data = '' # Empty files can't be memory mapped
+        else:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[:].decode('utf-8') # Gerber files are UTF-8 by spec
+
+    # Same newlines as reading in text mode
+    if '\r' in data:
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+
+    return GerberFile.from_string(data, filename=Path(path))
+
+def transform_file(file: GerberFile | ExcellonFile, module: Module) -> None:
+    """
+    Rotates and offsets a file to the module's placement, giving the same result as gerbonara's .rotate() followed
+    by .offset(). All of the file's coordinates are transformed together with NumPy, instead of point by point.
+    Parameters:
+        file (GerberFile | ExcellonFile): The file to transform in place.
+        module (Module): The module whose position and rotation are applied to the file.
+    Returns:
+        None
+    """
+    cos_a, sin_a, offset_x, offset_y = module.affine
+    rotation_radians = module.rotation_radians
+
+    # Like gerbonara, don't rotate at all for whole turns
+    if math.isclose(rotation_radians % (2 * math.pi), 0):
+        # Nothing to do for modules at the origin either, so skip walking the file's objects
+        if offset_x == 0 and offset_y == 0:
+            return
+        cos_a, sin_a = 1.0, 0.0
+    elif isinstance(file, GerberFile):
+        file.map_apertures(lambda aperture: aperture.rotated(rotation_radians))
+
+    # Drill files are almost always only holes in a single unit, which can skip gathering per-point offsets
+    if isinstance(file, ExcellonFile) and file.objects:
+        unit = file.objects[0].unit
+        if all(type(obj) is Flash and obj.unit == unit for obj in file.objects):
+            transform_drill_hits(file.objects, cos_a, sin_a, unit(offset_x, MM), unit(offset_y, MM))
+            return
+
+    # Gather every coordinate in the file, so they can all be transformed at once
+    coordinates = []
+    offsets = [] # Offset of each coordinate, zero for arc centers which are only rotated
+    for obj in file.objects:
+        # The offset is in mm, but coordinates are in the object's own unit
+        offset = (obj.unit(offset_x, MM), obj.unit(offset_y, MM))
+
+        if isinstance(obj, Flash):
+            coordinates.append((obj.x, obj.y))
+            offsets.append(offset)
+
+        elif isinstance(obj, Arc):
+            # The arc center is relative to its start point, so it's found from the rotated center and start point
+            coordinates += [(obj.x1, obj.y1), (obj.x2, obj.y2), (obj.x1 + obj.cx, obj.y1 + obj.cy), (obj.x1, obj.y1)]
+            offsets += [offset, offset, (0, 0), (0, 0)]
+
+        elif isinstance(obj, Line):
+            coordinates += [(obj.x1, obj.y1), (obj.x2, obj.y2)]
+            offsets += [offset, offset]
+
+        elif isinstance(obj, Region):
+            coordinates += obj.outline
+            offsets += [offset] * len(obj.outline)
+            # NOTE: Same as gerbonara, arc centers are rotated but not offset
+            arc_centers = [arc[1] for arc in obj.arc_centers if arc]
+            coordinates += arc_centers
+            offsets += [(0, 0)] * len(arc_centers)
+
         else:
-            # Save the transformed source file directly if no target file exists
-            source_file.save(target_file_path)
+            obj.rotate(rotation_radians)
+            obj.offset(offset_x, offset_y)
+
+    if not coordinates:
+        return
+
+    xy = np.array(coordinates, dtype=np.float64)
+    dxy = np.array(offsets, dtype=np.float64)
+    transformed = np.column_stack((
+        xy[:, 0] * cos_a - xy[:, 1] * sin_a + dxy[:, 0],
+        xy[:, 0] * sin_a + xy[:, 1] * cos_a + dxy[:, 1]
+    )).tolist()
+
+    # Write the coordinates back, in the same order they were gathered
+    points = iter(transformed)
+    for obj in file.objects:
+        if isinstance(obj, Flash):
+            obj.x, obj.y = next(points)
+
+        elif isinstance(obj, Arc):
+            (obj.x1, obj.y1), (obj.x2, obj.y2), (center_x, center_y), (x1, y1) = next(points), next(points), next(points), next(points)
+            obj.cx, obj.cy = center_x - x1, center_y - y1
+
+        elif isinstance(obj, Line):
+            (obj.x1, obj.y1), (obj.x2, obj.y2) = next(points), next(points)
+
+        elif isinstance(obj, Region):
+            obj.outline = [tuple(next(points)) for _ in obj.outline]
+            obj.arc_centers = [(arc[0], tuple(next(points))) if arc else None for arc in obj.arc_centers]
+
+def transform_drill_hits(hits: List[Flash], cos_a: float, sin_a: float, dx: float, dy: float) -> None:
+    """
+    Rotates and offsets drill hits in place, as one contiguous array of coordinates.
+    Parameters:
+        hits (List[Flash]): The drill hits, all in the same unit.
+        cos_a, sin_a (float): Cosine and sine of the rotation, as in Module.affine.
+        dx, dy (float): The offset, in the hits' unit.
+    Returns:
+        None
+    """
+    xy = np.array([(hit.x, hit.y) for hit in hits], dtype=np.float64)
+    x = xy[:, 0] * cos_a - xy[:, 1] * sin_a + dx
+    y = xy[:, 0] * sin_a + xy[:, 1] * cos_a + dy
+    for hit, new_x, new_y in zip(hits, x.tolist(), y.tolist()):
+        hit.x, hit.y = new_x, new_y
+
+def save_merged_files(target_dir_path: Path, source_files: List[Tuple[str, GerberFile | ExcellonFile]]) -> None:
+    """
+    Merges loaded Gerber and Excellon files into the same-named files in the target directory.
+    Parameters:
+        target_dir_path (Path): The path to the target directory where merged files will be saved.
+        source_files (List[Tuple[str, GerberFile | ExcellonFile]]): The loaded files, with their new filename.
+    Returns:
+        None
+    """
+    # Collect the files to be merged into each target file, in order
+    target_parts = {}
+    for new_file_name, source_file in source_files:
+        target_parts.setdefault(new_file_name, []).append(source_file)
+
+    for new_file_name, parts in target_parts.items():
+        target_file_path = target_dir_path / new_file_name
+
+        # Merge with the target file if it exists, otherwise the transformed source files are saved directly
+        if target_file_path.exists():
+            target_file = ExcellonFile.open(target_file_path) if isinstance(parts[0], ExcellonFile) else open_gerber(target_file_path)
+            parts.insert(0, target_file)
+
+        reduce_merge(parts).save(target_file_path)
+
+def reduce_merge(parts: List[GerberFile | ExcellonFile]) -> GerberFile | ExcellonFile | None:
+    """
+    Merges files pairwise, level by level, rather than merging them one at a time into an ever growing file.
+    The objects end up in the same order as if they were merged one after another.
+    Parameters:
+        parts (List[GerberFile | ExcellonFile]): The files to merge, in order. These are modified in place.
+    Returns:
+        GerberFile | ExcellonFile: The merged file (the first of parts), or None if there were no parts.
+    """
+    if not parts:
+        return None
+
+    while len(parts) > 1:
+        for first, second in zip(parts[0::2], parts[1::2]):
+            first.merge(second)
+        parts = parts[0::2]
+
+    return parts[0]
          
-def compress_directory(directory: Union[str, Path]):
+def compress_directory(directory: Union[str, Path], compression: int = zipfile.ZIP_DEFLATED):
     """ 
     Compresses the specified directory into a ZIP file.
     
     Parameters:
         directory (str or Path): The path to the directory to be compressed, 
                                and name given to the zip file.
+        compression (int, optional): zipfile compression method, e.g. zipfile.ZIP_STORED if the zip will be 
+                                     compressed again later. Defaults to zipfile.ZIP_DEFLATED.
     Returns:
         None
     """
     directory_path = Path(directory)
-    shutil.make_archive(str(directory_path), 'zip', str(directory_path))
+
+    # Gerber and drill files are plain text, so the fastest compression level shrinks them almost as much as the default
+    with zipfile.ZipFile(str(directory_path) + '.zip', 'w', compression, compresslevel=1) as zip_file:
+        for entry_path, arcname in walk_directory(directory_path):
+            zip_file.write(entry_path, arcname)
+
+def walk_directory(directory: Union[str, Path], prefix: str = ''):
+    """
+    Yields (path, name in archive) for every file and subdirectory in a directory, skipping symlinks.
+    
+    Parameters:
+        directory (str or Path): The directory to walk.
+        prefix (str, optional): Archive name of the directory, ending in '/'. Defaults to '' (the archive root).
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+
+            arcname = prefix + entry.name
+            yield entry.path, arcname
+            if entry.is_dir():
+                yield from walk_directory(entry.path, arcname + '/')
@@ -1,11 +1,63 @@
 import math
 import numpy as np
 from collections import defaultdict
-from typing import Dict, List, Tuple, DefaultDict
+from typing import Dict, List, Optional, Tuple, DefaultDict
 
 from board import Board
 from objects import Point, Segment
 
+def block_zones(grid: np.ndarray, zone_rectangles: List[Tuple], grid_center_x: int, grid_center_y: int,
+                resolution: float, blocked_cell: int) -> None:
+    """
+    Mark keep-out zones as blocked in the grid, converting every zone's corners to grid indices at once.
+    
+    Parameters:
+        grid: The grid to mark the zones in
+        zone_rectangles: Zones as (bottom left, top left, top right, bottom right) corners in mm
+        grid_center_x: Column of the board's origin
+        grid_center_y: Row of the board's origin
+        resolution: Grid resolution in mm
+        blocked_cell: Value of a blocked cell
+    """
+    zones = np.asarray(zone_rectangles, dtype=float)
+    if not zones.size:
+        return
+    
+    # Bottom left and top right corners, shape (zones, 2, 2)
+    corners = zones[:, [0, 2]]
+    columns = grid_center_x + np.rint(corners[..., 0] / resolution).astype(int)
+    rows = grid_center_y - np.rint(corners[..., 1] / resolution).astype(int)
+    
+    # Ensure bounds are within grid limits and handle coordinate flips
+    grid_height, grid_width = grid.shape
+    np.clip(columns, 0, grid_width - 1, out=columns)
+    np.clip(rows, 0, grid_height - 1, out=rows)
+    columns.sort(axis=1)
+    rows.sort(axis=1)
+    
+    # Mark cells in each rectangle as blocked
+    for (min_col, max_col), (min_row, max_row) in zip(columns.tolist(), rows.tolist()):
+        grid[min_row:max_row+1, min_col:max_col+1] = blocked_cell
+
+def block_around_cells(grid: np.ndarray, cells: np.ndarray, radius: int, blocked_cell: int) -> None:
+    """
+    Mark the square of cells within radius of each cell as blocked, clipped to the grid, all in one assignment.
+    
+    Parameters:
+        grid: The grid to mark the cells in
+        cells: The (column, row) of each cell, shape (cells, 2)
+        radius: Number of cells to block on every side of each cell
+        blocked_cell: Value of a blocked cell
+    """
+    offsets = np.arange(-radius, radius + 1)
+    row_offsets, column_offsets = np.meshgrid(offsets, offsets, indexing='ij')
+    rows = (cells[:, 1, None] + row_offsets.ravel()).ravel()
+    columns = (cells[:, 0, None] + column_offsets.ravel()).ravel()
+    
+    grid_height, grid_width = grid.shape
+    inside = (rows >= 0) & (rows < grid_height) & (columns >= 0) & (columns < grid_width)
+    grid[rows[inside], columns[inside]] = blocked_cell
+
 class Router: 
     """Base router class that provides common functionality for all router types."""
     
@@ -32,6 +84,9 @@ class Router:
         self.FREE_CELL = 1
         self.BLOCKED_CELL = 0
         
+        # Socket keep-out zones, stamped once for each keep-out size and reused for every socket that is routed
+        self.socket_margins: Dict[int, Tuple[np.ndarray, np.ndarray, Dict[Tuple[int, int], Tuple[int, List[Tuple[slice, slice]]]]]] = {}
+        
         # Create the base grid
         self.base_grid = self._create_base_grid()
                     
@@ -76,28 +131,11 @@ class Router:
 
     def _create_base_grid(self) -> np.ndarray:
         """Create the base grid for the entire board."""        
-        # Initialize grid with free cells
-        grid = np.full((self.grid_height, self.grid_width), self.FREE_CELL, dtype=int)
+        # Initialize grid with free cells, one byte each since cells are only ever free or blocked
+        grid = np.full((self.grid_height, self.grid_width), self.FREE_CELL, dtype=np.uint8)
         
         # Mark keep-out zones in the grid
-        for zone in self.board.zones.get_data():
-            bottom_left, top_left, top_right, bottom_right = zone
-            
-            # Convert coordinates to grid indices
-            bl_col, bl_row = self._coordinates_to_indices(bottom_left[0], bottom_left[1])
-            tr_col, tr_row = self._coordinates_to_indices(top_right[0], top_right[1])
-            
-            # Ensure bounds are within grid limits and handle coordinate flips
-            bl_col = max(0, min(self.grid_width - 1, bl_col))
-            tr_col = max(0, min(self.grid_width - 1, tr_col))
-            bl_row = max(0, min(self.grid_height - 1, bl_row))
-            tr_row = max(0, min(self.grid_height - 1, tr_row))
-            
-            min_col, max_col = min(bl_col, tr_col), max(bl_col, tr_col)
-            min_row, max_row = min(bl_row, tr_row), max(bl_row, tr_row)
-            
-            # Mark cells in the rectangle as blocked
-            grid[min_row:max_row+1, min_col:max_col+1] = self.BLOCKED_CELL
+        block_zones(grid, self.board.zones.get_data(), self.grid_center_x, self.grid_center_y, self.board.resolution, self.BLOCKED_CELL)
         
         return grid
     
@@ -131,28 +169,42 @@ class Router:
             return temporary_obstacle_grid
         
         # Find other nets on the same layer
+        path_cells = []
+        via_cells = []
         for net in current_layer.nets:
             if net == net_to_protect and self.board.allow_overlap:
                 continue  # Allow overlap would allow this net to overlap (short) with itself
             
-            # Mark all paths on other nets as obstacles
             for path in self.paths_indices.get(net, []):
-                for x, y, _ in path:
-                    if 0 <= y < self.grid_height and 0 <= x < self.grid_width:
-                        temporary_obstacle_grid[y, x] = self.BLOCKED_CELL
-                        
-            # Mark all the area around all vias as obstacles
-            for via_index in self.vias_indices.get(net, []):
-                x, y = via_index[0], via_index[1]  # Fix: Properly extract x and y from via_index
-                if 0 <= y < self.grid_height and 0 <= x < self.grid_width:
-                    for dy in range(-1, 2):  # Keep-out zone of 1 cell in each direction
-                        for dx in range(-1, 2):
-                            ny, nx = y + dy, x + dx  # Fix: Use the extracted x and y
-                            if 0 <= ny < self.grid_height and 0 <= nx < self.grid_width:
-                                temporary_obstacle_grid[ny, nx] = self.BLOCKED_CELL
+                path_cells.extend(path)
+            via_cells.extend((via_index[0], via_index[1]) for via_index in self.vias_indices.get(net, []))
+        
+        # Mark all paths on other nets as obstacles
+        block_around_cells(temporary_obstacle_grid, self._cells_inside_grid(path_cells), 0, self.BLOCKED_CELL)
+        
+        # Mark all the area around all vias as obstacles, with a keep-out zone of 1 cell in each direction
+        block_around_cells(temporary_obstacle_grid, self._cells_inside_grid(via_cells), 1, self.BLOCKED_CELL)
             
         return temporary_obstacle_grid
     
+    def _cells_inside_grid(self, cells: List[Tuple[int, ...]], first_column: int = 0, last_column: Optional[int] = None) -> np.ndarray:
+        """
+        Keep the cells that lie inside the grid.
+        
+        Parameters:
+            cells: Grid indices as (column, row, ...) tuples
+            first_column: Optional, first column to keep cells in
+            last_column: Optional, last column to keep cells in, defaults to the grid's last column
+        
+        Returns:
+            np.ndarray: The (column, row) of each cell inside the grid
+        """
+        if last_column is None:
+            last_column = self.grid_width - 1
+        cells = np.array([cell[:2] for cell in cells], dtype=np.int64).reshape(-1, 2)
+        inside = (cells[:, 1] >= 0) & (cells[:, 1] < self.grid_height) & (cells[:, 0] >= first_column) & (cells[:, 0] <= last_column)
+        return cells[inside]
+    
     def _apply_socket_margins(self, grid: np.ndarray, exposed_socket_index: Tuple[int, int], 
                              keep_out_mm: float = 0.5) -> np.ndarray:
         """
@@ -168,23 +220,56 @@ class Router:
         """
         temp_grid = np.copy(grid)
         keep_out_cells = self._to_grid_unit(keep_out_mm)
+        if keep_out_cells not in self.socket_margins:
+            self.socket_margins[keep_out_cells] = self._stamp_socket_margins(keep_out_cells)
+        covered, owners, margins = self.socket_margins[keep_out_cells]
         
-        # Mark all sockets for this other net as obstacles
-        for position in self.board.sockets.get_all_coordinates():
-            socket_index = self._coordinates_to_indices(position[0], position[1])    
-            for i in range(-keep_out_cells+1, keep_out_cells):
-                for j in range(-keep_out_cells+1, keep_out_cells):
-                    column = socket_index[0] + i
-                    row = socket_index[1] + j
-                    # Check if within grid boundaries
-                    if 0 <= column < self.grid_width and 0 <= row < self.grid_height:
-                        if socket_index == exposed_socket_index:
-                            temp_grid[row, column] = self.FREE_CELL
-                        else: 
-                            temp_grid[row, column] = self.BLOCKED_CELL
+        # Mark all sockets as obstacles
+        np.copyto(temp_grid, self.BLOCKED_CELL, where=covered)
+        
+        # Free the exposed socket, except where a later socket's keep-out zone was stamped over it
+        if exposed_socket_index in margins:
+            owner, socket_margins = margins[exposed_socket_index]
+            for margin in socket_margins:
+                temp_grid[margin][owners[margin] == owner] = self.FREE_CELL
                             
         return temp_grid
     
+    def _stamp_socket_margins(self, keep_out_cells: int) -> Tuple[np.ndarray, np.ndarray, Dict[Tuple[int, int], Tuple[int, List[Tuple[slice, slice]]]]]:
+        """
+        Stamp the keep-out zones of all sockets, in order, so the last socket stamped over a cell owns it.
+        
+        Parameters:
+            keep_out_cells: Keep-out zone size in grid cells
+        
+        Returns:
+            The cells covered by any keep-out zone, the owner of each cell (-1 for none), and the owner and keep-out 
+            zones of each socket index
+        """
+        covered = np.zeros((self.grid_height, self.grid_width), dtype=bool)
+        owners = np.full((self.grid_height, self.grid_width), -1, dtype=np.int32)
+        margins = {}
+        
+        for position in self.board.sockets.get_all_coordinates():
+            socket_index = self._coordinates_to_indices(position[0], position[1])    
+            
+            # The keep-out zone is a square around the socket, clipped to the grid boundaries
+            min_column = max(0, socket_index[0] - keep_out_cells + 1)
+            max_column = min(self.grid_width, socket_index[0] + keep_out_cells)
+            min_row = max(0, socket_index[1] - keep_out_cells + 1)
+            max_row = min(self.grid_height, socket_index[1] + keep_out_cells)
+            if min_column >= max_column or min_row >= max_row:
+                continue
+            
+            # Sockets at the same grid index share an owner, since they're exposed together
+            owner, socket_margins = margins.setdefault(socket_index, (len(margins), []))
+            margin = (slice(min_row, max_row), slice(min_column, max_column))
+            covered[margin] = True
+            owners[margin] = owner
+            socket_margins.append(margin)
+        
+        return covered, owners, margins
+    
     def _convert_trace_indices_to_segments(self) -> None:
         """
         Convert grid paths to physical line segments and assign them to board layers directly.
@@ -7,6 +7,9 @@ as it will refer to a different namespace with different variables
 import threading
 
 thread_context = threading.local()
+# Per-thread attributes, set when first used:
+#   module_manifest         Module directory listings, see process.build_module_manifest
+#   module_manifest_job_id  Job the module manifest was built for
 
 # NOTE: NOT USE global variables in ANY code, since those are shared between all threads!
 job_id = None